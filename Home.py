@@ -1,5 +1,16 @@
+import datetime
 import streamlit as st
 import consts as C
+from data import (
+   get_ledger,
+   get_income,
+   show_data_age,
+   start_run,
+   show_debug
+)
+from ledger import get_cube, COLS_CUBE_INCOME
+from figures import get_memo, build_df_net
+from budget import evaluate_budgets
 
 
 
@@ -18,4 +29,56 @@ st.set_page_config(
 # Balance #
 # ======= #
 st.header('滿月記帳表')
-st.markdown(':construction: :construction_worker: :construction:')
+profiler = start_run()
+df_out, data_version, loaded_at, load_timings = get_ledger()
+show_data_age(loaded_at)
+df_cube = get_cube(df_out, data_version)
+df_net = get_memo(
+   data_version, ('net',), build_df_net,
+   df_cube,
+   get_cube(get_income(data_version), data_version, COLS_CUBE_INCOME)
+)
+
+# Latest month against the one before, then the year so far
+ym_latest = df_net[C.COL_MM].iloc[-1]
+row = df_net.iloc[-1]
+row_prev = df_net.iloc[-2] if len(df_net) > 1 else None
+st.subheader(ym_latest)
+for col, label in zip(st.columns(3), [C.COL_INCOME, C.COL_SPENT, C.COL_NET]):
+   col.metric(
+      label=label,
+      value=f'${row[label]:,}',
+      delta=None if row_prev is None else f'{row[label] - row_prev[label]:,}',
+      delta_color='inverse' if label == C.COL_SPENT else 'normal'
+   )
+
+df_year = df_net[df_net[C.COL_MM].str[:4] == ym_latest[:4]]
+st.subheader(ym_latest[:4])
+for col, label in zip(st.columns(3), [C.COL_INCOME, C.COL_SPENT, C.COL_NET]):
+   col.metric(label=label, value=f'${df_year[label].sum():,}')
+
+
+# ======= #
+# Budgets #
+# ======= #
+st.subheader(C.COL_BUDGET)
+today = datetime.date.today()
+df_budget = get_memo(
+   data_version, ('預算', ym_latest, today), evaluate_budgets,
+   df_cube, ym_latest, today
+)
+for _, row in df_budget[df_budget[C.COL_ALERT] != ''].iterrows():
+   message = (
+      f'{row[C.COL_BUDGET_GROUP]}：{row[C.COL_ALERT]}預算 '
+      f'${row[C.COL_BUDGET]:,}（到今 ${row[C.COL_MTD]:,}，'
+      f'月底 ${row[C.COL_PROJECTED]:,}）'
+   )
+   if row[C.COL_ALERT] == C.ALERT_OVER:
+      st.error(message)
+   else:
+      st.warning(message)
+st.dataframe(df_budget, hide_index=True, use_container_width=True)
+
+
+# === Debug === #
+show_debug(load_timings, profiler)
@@ -0,0 +1,85 @@
+import re
+import json
+import hashlib
+import pandas as pd
+import consts as C
+from utils import to_amount, get_trie_pattern, match_rules
+from sources import parse_dates
+from reconcile import get_bill_pattern, items_to_cards
+
+
+# ============ #
+# Income kinds #
+# ============ #
+# Matched against store + item of each deposit, the first kind wins
+INCOME_RULES = [
+   (C.INC_SALARY, ['薪資', '薪水', '薪津']),
+   (C.INC_BONUS, ['獎金', '年終', '紅利']),
+   (C.INC_INTEREST, ['利息', '結息', '存息']),
+   (C.INC_REFUND, ['退款', '退費', '退貨', '退刷', '退稅']),
+   (C.INC_TRANSFER, ['轉入', '轉帳', '跨行', '匯入', '存款'])
+]
+INCOME_PATTERNS = [
+   (kind, re.compile(get_trie_pattern(kws))) for kind, kws in INCOME_RULES
+]
+
+
+def get_income_rules_hash():
+   return hashlib.sha1(
+      json.dumps(INCOME_RULES, ensure_ascii=False).encode('utf-8')
+   ).hexdigest()[:16]
+
+
+def deposits_to_kinds(sr):
+   return match_rules(sr, INCOME_PATTERNS, C.INC_DEFAULT)
+
+
+# ========= #
+# Bank rows #
+# ========= #
+def parse_bank_rows(df, adapter, yy):
+   # The rows of a raw bank tab (all text) that are not spending, parsed
+   # once along with the ledger by ingest_table: side table name -> rows.
+   # Money coming in, and card bills paid (dropped from spending by the
+   # adapter's filter, matched to the card sheets by the reconciliation)
+   if adapter['col_deposit'] is None:
+      return dict()
+   df = df.assign(**{C.COL_DATE: parse_dates(df, adapter['date_format'], yy)})
+   df = df[df[C.COL_DATE].notna()]
+   deposit = to_amount(df[adapter['col_deposit']]).astype('int64')
+   amount = to_amount(df[C.COL_AMOUNT]).astype('int64')
+
+   # The amounts are filtered too: assigning a whole column to an empty
+   # frame would bring back every row
+   is_income = deposit > 0
+   df_income = df[is_income].assign(**{C.COL_AMOUNT: deposit[is_income]})
+   df_income[C.COL_KIND] = pd.Categorical(
+      deposits_to_kinds(df_income[C.COL_STORE] + df_income[C.COL_ITEM]),
+      categories=C.INCOMES
+   )
+   df_income[C.COL_SOURCE] = adapter['source']
+
+   is_bill = df[C.COL_ITEM].str.contains(get_bill_pattern()) & (amount > 0)
+   df_payments = df[is_bill].assign(**{C.COL_AMOUNT: amount[is_bill]})
+   df_payments[C.COL_SOURCE] = items_to_cards(df_payments[C.COL_ITEM])
+   return dict(
+      income=df_income[C.COLS_INCOME],
+      payments=df_payments[C.COLS_PAYMENT]
+   )
+
+
+# =========== #
+# Net balance #
+# =========== #
+def get_monthly_net(df_spent, df_income):
+   # Both are monthly aggregates: slice_cube(cube, C.COL_MM) of each side
+   df = pd.DataFrame({
+      C.COL_INCOME: df_income.set_index(
+         df_income[C.COL_MM].astype(str)
+      )[C.COL_AMOUNT],
+      C.COL_SPENT: df_spent.set_index(
+         df_spent[C.COL_MM].astype(str)
+      )[C.COL_AMOUNT]
+   }).fillna(0).astype('int64').sort_index()
+   df[C.COL_NET] = df[C.COL_INCOME] - df[C.COL_SPENT]
+   return df.rename_axis(C.COL_MM).reset_index()
@@ -0,0 +1,292 @@
+import io
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+import consts as C
+import utils
+import ledger
+import query
+from fetch import fetch_sheets
+from sources import ADAPTERS, get_adapter_jobs, normalize_table
+
+
+# ================ #
+# Synthetic ledger #
+# ================ #
+ITEMS = ['', '', '', '午餐', '晚頓', '儲值', '孝親', '房租', '花旗卡費']
+TAGS_HANDWRITTEN = ['', '', '', '', C.TAG_FORAGE, C.TAG_BOOK, C.TAG_COMMUTE]
+NUM_UNKNOWN_STORES = 2000
+
+
+def get_merchant_pool():
+   # Known keywords dressed up the way bank statements write them, plus
+   # stores no rule knows about
+   keywords = [kw for _, kws in utils.STORE_TAG_RULES for kw in kws]
+   decorations = [''] * 4 + list(utils.STORE_LOCATIONS + utils.STORE_SUFFIXES)
+   pool = [
+      f'{kw}{decoration}'
+      for kw in keywords
+      for decoration in decorations[::3]
+   ]
+   pool += [f'無名店{idx}' for idx in range(NUM_UNKNOWN_STORES)]
+   return np.array(pool, dtype=object)
+
+
+def gen_table(adapter, yy, num_rows, rng):
+   merchants = get_merchant_pool()
+   days = pd.to_datetime(f'{yy}-01-01') + pd.to_timedelta(
+      rng.integers(0, 365, num_rows), unit='D'
+   )
+   amounts = rng.lognormal(5, 1.2, num_rows).round().astype(int) + 1
+   values = {
+      C.COL_STORE: merchants[rng.integers(0, len(merchants), num_rows)],
+      C.COL_ITEM: rng.choice(ITEMS, num_rows),
+      C.COL_AMOUNT: amounts,
+      C.COL_DEPOSIT: np.where(rng.random(num_rows) < 0.05, amounts * 10, 0),
+      C.COL_TAG: rng.choice(TAGS_HANDWRITTEN, num_rows),
+      C.COL_FREQ: '',
+      C.COL_PAY: ''
+   }
+   if adapter['date_format'] is None:
+      values[C.COL_MM] = days.month
+      values[C.COL_DD] = days.day
+   else:
+      values[C.COL_DATE] = days.strftime(adapter['date_format'])
+   df = pd.DataFrame(values).reindex(columns=adapter['cols'])
+   buf = io.StringIO()
+   df.to_csv(buf, index=False)
+   return buf.getvalue().encode('utf-8')
+
+
+def gen_ledger(num_rows, seed=0):
+   # {(sheet_id, table): csv bytes}, rows spread evenly over every tab
+   rng = np.random.default_rng(seed)
+   jobs = [
+      (adapter, yy)
+      for adapter in ADAPTERS.values()
+      for yy in adapter['tables']
+   ]
+   return {
+      (adapter['sheet_id'], yy): gen_table(
+         adapter, yy, num_rows // len(jobs) + 1, rng
+      )
+      for adapter, yy in jobs
+   }
+
+
+# =============== #
+# Stand-in server #
+# =============== #
+def serve_sheets(contents):
+   # Answers gviz CSV requests the way docs.google.com does, from memory:
+   # keep-alive and gzip when asked for
+   class SheetHandler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def do_GET(self):
+         url = urlparse(self.path)
+         sheet_id = url.path.strip('/').split('/')[0]
+         table = parse_qs(url.query).get('sheet', [''])[0]
+         content = contents.get((sheet_id, table))
+         if content is None:
+            self.send_error(404)
+            return
+         self.send_response(200)
+         self.send_header('Content-Type', 'text/csv; charset=utf-8')
+         if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content, compresslevel=1)
+            self.send_header('Content-Encoding', 'gzip')
+         self.send_header('Content-Length', str(len(content)))
+         self.end_headers()
+         self.wfile.write(content)
+
+      def log_message(self, *args):
+         pass
+
+   server = ThreadingHTTPServer(('127.0.0.1', 0), SheetHandler)
+   threading.Thread(target=server.serve_forever, daemon=True).start()
+   return server
+
+
+# ====== #
+# Stages #
+# ====== #
+def clear_caches():
+   utils.STORE_TRIM_CACHE.clear()
+   utils.STORE_LOOKUP.clear()
+   ledger.CUBES.clear()
+   query.INDEXES.clear()
+
+
+def measure(results, stage, num_rows, func, *args, is_memory=False):
+   # tracemalloc slows pure Python code several times over, so a run
+   # measures either time or peak memory, never both
+   if is_memory:
+      tracemalloc.start()
+      ret = func(*args)
+      result = dict(peak_mb=tracemalloc.get_traced_memory()[1] / 2 ** 20)
+      tracemalloc.stop()
+   else:
+      start = time.perf_counter()
+      ret = func(*args)
+      result = dict(seconds=time.perf_counter() - start)
+   results.append(dict(stage=stage, rows=num_rows, **result))
+   unit, value = ('MB', result['peak_mb']) if is_memory else (
+      's', result['seconds']
+   )
+   print(f'{num_rows:>9} {stage:<14} {value:10.3f}{unit}', file=sys.stderr)
+   return ret
+
+
+def parse_tables(contents):
+   return [
+      (adapter, yy, utils.load_df_from_content(
+         contents[adapter['sheet_id'], yy], adapter['cols']
+      ))
+      for adapter in ADAPTERS.values()
+      for yy in adapter['tables']
+   ]
+
+
+def normalize_tables(tables):
+   return pd.concat(
+      [normalize_table(df, adapter, yy) for adapter, yy, df in tables],
+      ignore_index=True
+   )
+
+
+def build_charts(df_cube):
+   # The aggregations the Spending page runs on every rerun
+   df_monthly = ledger.slice_cube(df_cube, C.COL_MM)
+   for col_group in (C.COL_CLASS, C.COL_FREQ, C.COL_PAY):
+      ledger.slice_cube(df_cube, [C.COL_MM, col_group])
+      for ym in df_monthly[C.COL_MM]:
+         ledger.slice_cube(df_cube, col_group, {C.COL_MM: ym})
+   return df_monthly
+
+
+def run_size(num_rows, is_memory=False):
+   results = []
+   contents = gen_ledger(num_rows)
+   num_rows = sum(content.count(b'\n') - 1 for content in contents.values())
+   server = serve_sheets(contents)
+   end_point, cache_dir = C.END_POINT, C.CACHE_DIR
+   C.END_POINT = f'http://127.0.0.1:{server.server_port}'
+   root = tempfile.mkdtemp(prefix='bench-')
+   C.CACHE_DIR = os.path.join(root, 'stages')
+   clear_caches()
+   try:
+      def step(stage, func, *args):
+         return measure(
+            results, stage, num_rows, func, *args, is_memory=is_memory
+         )
+
+      contents = step(
+         'fetch', fetch_sheets, get_adapter_jobs(), C.FETCH_WORKERS, 0
+      )
+      tables = step('parse', parse_tables, contents)
+      df = step('normalize', normalize_tables, tables)
+      sr_stores = pd.Series(df[C.COL_STORE].unique(), dtype=object)
+      sr_trimmed = step('trim', utils.trim_stores, sr_stores)
+      step('tag', utils.stores_to_tags, sr_trimmed)
+      clear_caches()
+      step('classify', utils.classify_stores, df[C.COL_STORE])
+      # classify persisted its store lookup, a cold load starts from an
+      # empty cache directory so that it trims and tags every store again
+      C.CACHE_DIR = os.path.join(root, 'load')
+      clear_caches()
+      df, _ = step('load_cold', ledger.load_ledger)
+      step('load_warm', ledger.load_ledger)
+      df_cube = step('aggregate', ledger.build_cube, df)
+      step('charts', build_charts, df_cube)
+      index = step('index', query.build_index, df)
+      step(
+         'query', query.filter_ledger, df, index,
+         f'{C.COL_CLASS}={C.CLS_DINE} {C.COL_STORE}~全家'
+      )
+   finally:
+      server.shutdown()
+      shutil.rmtree(root, ignore_errors=True)
+      C.END_POINT, C.CACHE_DIR = end_point, cache_dir
+   return results
+
+
+def get_commit():
+   try:
+      return subprocess.run(
+         ['git', 'rev-parse', '--short', 'HEAD'],
+         cwd=os.path.dirname(os.path.abspath(__file__)),
+         capture_output=True, text=True, check=True
+      ).stdout.strip()
+   except (OSError, subprocess.CalledProcessError):
+      return None
+
+
+# ================ #
+# Command line app #
+# ================ #
+def main(argv=None):
+   parser = argparse.ArgumentParser(
+      description='Time and measure each ledger stage on synthetic sheets'
+   )
+   parser.add_argument(
+      'rows', nargs='*', type=int, default=[1000, 10000, 100000],
+      help='ledger sizes, e.g. 1000 1000000'
+   )
+   parser.add_argument('-o', '--output', help='JSON file, defaults to stdout')
+   parser.add_argument(
+      '--no-memory', action='store_true',
+      help='skip the second, tracemalloc pass for peak memory'
+   )
+   args = parser.parse_args(argv)
+   # Always through the stand-in server, never an offline snapshot
+   os.environ.pop(C.ENV_OFFLINE_DIR, None)
+   C.OFFLINE_DIR = None
+
+   results = []
+   for num_rows in args.rows:
+      results_size = run_size(num_rows)
+      if not args.no_memory:
+         for result, result_memory in zip(
+            results_size, run_size(num_rows, is_memory=True)
+         ):
+            result.update(result_memory)
+      results += results_size
+   report = dict(
+      commit=get_commit(),
+      python=platform.python_version(),
+      pandas=pd.__version__,
+      numpy=np.__version__,
+      results=[
+         dict(
+            result,
+            seconds=round(result['seconds'], 4),
+            peak_mb=round(result['peak_mb'], 1) if 'peak_mb' in result
+            else None
+         )
+         for result in results
+      ]
+   )
+   text = json.dumps(report, indent=1)
+   if args.output is None:
+      print(text)
+   else:
+      with open(args.output, 'w', encoding='utf-8') as f:
+         f.write(text)
+
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,83 @@
+import calendar
+import datetime
+import numpy as np
+import pandas as pd
+import consts as C
+from ledger import slice_cube
+
+
+# ======= #
+# Budgets #
+# ======= #
+# Budgets of each column the cube is sliced by
+BUDGETS = {
+   C.COL_CLASS: C.BUDGETS_CLASS,
+   C.COL_TAG: C.BUDGETS_TAG
+}
+
+
+# =============== #
+# Private helpers #
+# =============== #
+def get_month_progress(ym, today=None):
+   # Share of the month gone by: 1 for a closed month, 0 for a future one
+   today = today or datetime.date.today()
+   yy, mm = map(int, ym.split('/'))
+   num_days = calendar.monthrange(yy, mm)[1]
+   if (yy, mm) < (today.year, today.month):
+      return 1.0
+   if (yy, mm) > (today.year, today.month):
+      return 0.0
+   return today.day / num_days
+
+
+def get_month_spend(df_cube, col, ym):
+   # Month-to-date spend of each group, split into fixed and variable: only
+   # the variable part is scaled up to the month end
+   df_month = slice_cube(df_cube, [col, C.COL_FREQ], {C.COL_MM: ym})
+   is_fixed = df_month[C.COL_FREQ].isin(C.BUDGET_FREQS_FIXED)
+   return pd.DataFrame({
+      C.COL_MTD: df_month.groupby(col, observed=True)[C.COL_AMOUNT].sum(),
+      'fixed': df_month[is_fixed].groupby(
+         col, observed=True
+      )[C.COL_AMOUNT].sum()
+   }).fillna(0)
+
+
+# ============== #
+# Public helpers #
+# ============== #
+def evaluate_budgets(df_cube, ym, today=None):
+   # Only the cells of month ym in the cached cube are read
+   progress = get_month_progress(ym, today)
+   dfs = []
+   for col, budgets in BUDGETS.items():
+      if not budgets:
+         continue
+      df_spend = get_month_spend(df_cube, col, ym).reindex(list(budgets))
+      df_spend = df_spend.fillna(0).astype('int64')
+      variable = df_spend[C.COL_MTD] - df_spend['fixed']
+      if progress > 0:
+         variable = variable / progress
+      dfs.append(pd.DataFrame({
+         C.COL_BUDGET_BY: col,
+         C.COL_BUDGET_GROUP: list(budgets),
+         C.COL_BUDGET: list(budgets.values()),
+         C.COL_MTD: df_spend[C.COL_MTD].to_numpy(),
+         C.COL_PROJECTED: (
+            df_spend['fixed'] + variable
+         ).round().astype('int64').to_numpy()
+      }))
+   if not dfs:
+      return pd.DataFrame(columns=C.COLS_BUDGET)
+
+   df = pd.concat(dfs, ignore_index=True)
+   df[C.COL_ALERT] = np.select(
+      [
+         df[C.COL_MTD] > df[C.COL_BUDGET],
+         df[C.COL_PROJECTED] > df[C.COL_BUDGET]
+      ],
+      [C.ALERT_OVER, C.ALERT_PROJECTED],
+      default=''
+   )
+   return df[C.COLS_BUDGET]
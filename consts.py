@@ -3,6 +3,7 @@
 # ============= #
 PAGE_TITLE = '布基帳'
 PAGE_ICON = ':whale:'
+ENV_DEBUG = 'LEDGER_DEBUG'  # set to 1 for the timing and profiling panel
 
 
 # ============ #
@@ -14,6 +15,20 @@ SHEET_ID_CASH = '1DNvY54rC1IaExN-xgnMYW3ru5lNXv0RjbqswakcGQh8'
 SHEET_ID_CARD_CITI = '1_eIEiaS6IiKqTIrSVUaNqd5jtjO2M9IWa2zsPIOsYpQ'
 SHEET_ID_CARD_TSIB = '1uM-1q8jDAgpPuyAdRVdWX97EXJAFmUkbtuXk8p0AqME'
 YY_LIST = ['2021', '2022', '2023']
+YY_LIST_CARD = ['2022', '2023']
+
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 10
+FETCH_RETRIES = 3
+FETCH_BACKOFF = 0.5
+
+CACHE_DIR = '.cache'
+CACHE_TTL = 10 * 60  # seconds, only for tabs of the current year
+
+# Offline mode reads tabs from a snapshot (see sync.py) instead of Google;
+# the env var wins over OFFLINE_DIR, the cache dir itself is a valid one
+OFFLINE_DIR = None
+ENV_OFFLINE_DIR = 'LEDGER_OFFLINE_DIR'
 
 
 # ======== #
@@ -31,6 +46,9 @@ COL_FREQ = '頻率'
 COL_PAY = '方式'
 
 COLS_SPENDING = [COL_TAG, COL_FREQ, COL_PAY]
+COLS_LEDGER = [
+   COL_DATE, COL_STORE, COL_ITEM, COL_AMOUNT
+] + COLS_SPENDING
 
 
 # ==== #
@@ -110,6 +128,11 @@ TAGS_MOVE = [TAG_CAR, TAG_SCOOTER, TAG_COMMUTE, TAG_TAXI]
 
 TAG_DEFAULT = f'無{COL_TAG}'
 
+TAGS = [
+   *TAGS_RENT, *TAGS_LIFE, *TAGS_COOK, *TAGS_DINE,
+   *TAGS_FUN, *TAGS_HEALTH, *TAGS_MOVE, TAG_DEFAULT
+]
+
 
 # =============== #
 # Derived classes #
@@ -161,6 +184,115 @@ PAY_CASH = '現金'
 PAYS = [PAY_CARD, PAY_DIGIT, PAY_CASH]
 
 
+# ====== #
+# Income #
+# ====== #
+COL_INCOME = '入'
+COL_SPENT = '開'
+COL_NET = '賰'
+COL_KIND = '款'
+
+INC_SALARY = '薪水'
+INC_BONUS = '獎金'
+INC_INTEREST = '利息'
+INC_REFUND = '退錢'
+INC_TRANSFER = '轉入'
+INC_DEFAULT = f'無{COL_KIND}'
+
+INCOMES = [
+   INC_SALARY, INC_BONUS, INC_INTEREST, INC_REFUND, INC_TRANSFER,
+   INC_DEFAULT
+]
+
+
+# ======= #
+# Sources #
+# ======= #
+COL_SOURCE = '源'
+
+SRC_CASH = '現金'
+SRC_CTBC = '中信'
+SRC_CITI = '花旗'
+SRC_TSIB = '台新'
+
+
+# ====== #
+# Ledger #
+# ====== #
+COL_YM = '年月'
+COL_COUNT = '筆'
+
+IMPORT_CHUNKSIZE = 50000
+
+COLS_NORMALIZED = COLS_LEDGER + [COL_CLASS, COL_SOURCE]
+COLS_DERIVED = [COL_MM, COL_DD, COL_YM]  # all from COL_DATE
+COLS_INCOME = [
+   COL_DATE, COL_STORE, COL_ITEM, COL_AMOUNT, COL_KIND, COL_SOURCE
+]
+COLS_PAYMENT = [COL_DATE, COL_ITEM, COL_AMOUNT, COL_SOURCE]
+
+
+# ============== #
+# Reconciliation #
+# ============== #
+COL_MATCH = '對'
+COL_GAP = '差幾工'
+
+# A card bill is paid within this many days after its month ends
+RECONCILE_BILL_DAYS = 60
+# A top-up and its twin in another sheet are this many days apart at most
+RECONCILE_TOPUP_DAYS = 3
+
+
+# ================= #
+# Recurring expense #
+# ================= #
+# Share of a store's gaps that must fall in a rule's band
+RECURRING_SHARE = 0.75
+# Subscriptions vary by at most this share of their usual amount
+RECURRING_AMOUNT_SPREAD = 0.05
+
+
+# ======= #
+# Budgets #
+# ======= #
+COL_BUDGET = '預算'
+COL_BUDGET_BY = '照'
+COL_BUDGET_GROUP = '組'
+COL_MTD = '到今'
+COL_PROJECTED = '月底'
+COL_ALERT = '警告'
+
+# Monthly budgets in dollars, classes and tags left out have none
+BUDGETS_CLASS = {
+   CLS_COOK: 6000,
+   CLS_DINE: 8000,
+   CLS_FUN: 5000,
+   CLS_MOVE: 3000
+}
+BUDGETS_TAG = {
+   TAG_DRINK: 1500,
+   TAG_STREAM: 500
+}
+# Paid once a month or less, so not scaled up to the month end
+BUDGET_FREQS_FIXED = [FREQ_MONTH, FREQ_BIMONTH, FREQ_YEAR, FREQ_SUB]
+
+ALERT_OVER = '超過'
+ALERT_PROJECTED = '會超過'
+
+COLS_BUDGET = [
+   COL_BUDGET_BY, COL_BUDGET_GROUP, COL_BUDGET,
+   COL_MTD, COL_PROJECTED, COL_ALERT
+]
+
+
+# ========== #
+# Statistics #
+# ========== #
+# Window choices of the monthly chart overlays, the first is the default
+STATS_WINDOWS = [3, 6, 12]
+
+
 ########
 # Plot #
 ########
@@ -0,0 +1,101 @@
+import os
+import time
+import cProfile
+import pandas as pd
+import streamlit as st
+import consts as C
+from fetch import get_offline_dir
+from ledger import load_ledger, load_table, get_store_root
+from timing import pop_timings, log_timings, summarize_timings, format_profile
+
+
+# ====== #
+# Ledger #
+# ====== #
+@st.cache_data(ttl=C.CACHE_TTL)
+def get_ledger():
+   # Widget interactions rerun the page but hit this cache, so only the
+   # charts are rebuilt; the version tells the cube when data changed.
+   # The load's stage timings are cached along for the debug panel
+   pop_timings()
+   df, version = load_ledger()
+   timings = pop_timings()
+   log_timings(timings)
+   return df, version, time.time(), timings
+
+
+@st.cache_data(ttl=C.CACHE_TTL)
+def get_income(version):
+   # Built along with the ledger from the same tabs, so only a disk read;
+   # version is the cache key
+   return load_table('income', get_store_root())
+
+
+@st.cache_data(ttl=C.CACHE_TTL)
+def get_payments(version):
+   # Card bills paid from the bank, for the reconciliation
+   return load_table('payments', get_store_root())
+
+
+def refresh_ledger():
+   load_ledger(ttl=0)
+   get_ledger.clear()
+   get_income.clear()
+   get_payments.clear()
+
+
+def show_data_age(loaded_at):
+   col_age, col_refresh = st.columns([5, 1])
+   minutes = int((time.time() - loaded_at) // 60)
+   offline_dir = get_offline_dir()
+   col_age.caption(
+      f"{time.strftime('%Y/%m/%d %H:%M', time.localtime(loaded_at))} 載入"
+      f"（{minutes} 分鐘前）{f'，離線：{offline_dir}' if offline_dir else ''}"
+   )
+   if col_refresh.button('更新'):
+      refresh_ledger()
+      st.rerun()
+
+
+# ===== #
+# Debug #
+# ===== #
+def is_debug():
+   return os.environ.get(C.ENV_DEBUG) == '1'
+
+
+def start_run():
+   # Called first on every page, so each run only reports its own stages;
+   # whatever an interrupted run left behind is logged, then dropped
+   log_timings(pop_timings())
+   return start_profile()
+
+
+def start_profile():
+   # Only the one rerun requested from the debug panel is profiled
+   if not st.session_state.pop('is_profiling', False):
+      return None
+   profiler = cProfile.Profile()
+   profiler.enable()
+   return profiler
+
+
+def show_debug(load_timings, profiler=None):
+   timings = pop_timings()
+   log_timings(timings)
+   if profiler is not None:
+      profiler.disable()
+      st.session_state['profile'] = format_profile(profiler)
+   if not is_debug():
+      return
+
+   with st.expander('除錯'):
+      for label, records in (('載入', load_timings), ('這擺', timings)):
+         st.caption(label)
+         st.table(pd.DataFrame(summarize_timings(records)))
+      st.json(load_timings + timings, expanded=False)
+      if st.button('剖析後一擺'):
+         st.session_state['is_profiling'] = True
+         st.rerun()
+      if 'profile' in st.session_state:
+         st.code(st.session_state['profile'])
@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+import consts as C
+from timing import timed
+
+
+# =============== #
+# Private helpers #
+# =============== #
+def is_retryable(err):
+   if isinstance(err, requests.HTTPError):
+      return err.response is not None and (
+         err.response.status_code == 429 or err.response.status_code >= 500
+      )
+   return isinstance(err, (requests.ConnectionError, requests.Timeout))
+
+
+def is_closed_table(table):
+   return table.isdigit() and int(table) < date.today().year
+
+
+SESSIONS = dict()
+SESSIONS_LOCK = threading.Lock()
+
+
+def get_session():
+   # One keep-alive session for every tab, its pool as wide as the fetch pool
+   with SESSIONS_LOCK:
+      if 'http' not in SESSIONS:
+         session = requests.Session()
+         session.headers['Accept-Encoding'] = 'gzip, deflate'
+         adapter = HTTPAdapter(pool_maxsize=C.FETCH_WORKERS)
+         session.mount('https://', adapter)
+         session.mount('http://', adapter)
+         SESSIONS['http'] = session
+      return SESSIONS['http']
+
+
+def get_cache_path(sheet_id, table, ext, root=None):
+   return os.path.join(
+      root or C.CACHE_DIR, 'sheets', sheet_id, f'{table}.{ext}'
+   )
+
+
+def write_atomic(path, data):
+   os.makedirs(os.path.dirname(path), exist_ok=True)
+   path_tmp = f'{path}.tmp'
+   with open(path_tmp, 'wb') as f:
+      f.write(data)
+   os.replace(path_tmp, path)
+
+
+def read_cache(sheet_id, table):
+   try:
+      with open(get_cache_path(sheet_id, table, 'json')) as f:
+         meta = json.load(f)
+      with open(get_cache_path(sheet_id, table, 'csv'), 'rb') as f:
+         content = f.read()
+   except (OSError, ValueError):
+      return None, None
+   if hashlib.sha256(content).hexdigest() != meta.get('sha256'):
+      return None, None
+   return content, meta
+
+
+def write_cache(sheet_id, table, content, meta):
+   sha256 = hashlib.sha256(content).hexdigest()
+   if meta is None or meta.get('sha256') != sha256:
+      write_atomic(get_cache_path(sheet_id, table, 'csv'), content)
+   meta = dict(meta or dict(), sha256=sha256, fetched_at=time.time())
+   write_atomic(
+      get_cache_path(sheet_id, table, 'json'),
+      json.dumps(meta).encode('utf-8')
+   )
+
+
+# ============== #
+# Public helpers #
+# ============== #
+def get_sheet_url(sheet_id, table):
+   return f'{C.END_POINT}/{sheet_id}/gviz/tq?tqx=out:csv&sheet={table}'
+
+
+def get_response(
+   url,
+   headers=None,
+   timeout=C.FETCH_TIMEOUT,
+   retries=C.FETCH_RETRIES,
+   backoff=C.FETCH_BACKOFF
+):
+   for attempt in range(retries + 1):
+      try:
+         res = get_session().get(url, headers=headers, timeout=timeout)
+         res.raise_for_status()
+         return res
+      except requests.RequestException as err:
+         if attempt == retries or not is_retryable(err):
+            raise
+         time.sleep(backoff * 2 ** attempt)
+
+
+def fetch_sheet(sheet_id, table, ttl=C.CACHE_TTL):
+   # Closed years never change, the current year is revalidated after ttl;
+   # ttl=0 revalidates every table
+   with timed('fetch', sheet=sheet_id[:8], table=table) as record:
+      content, meta = read_cache(sheet_id, table)
+      is_fresh = content is not None and ttl > 0 and (
+         is_closed_table(table) or time.time() - meta['fetched_at'] < ttl
+      )
+      record['status'] = 'cache'
+      if not is_fresh:
+         headers = dict()
+         if content is not None and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+         res = get_response(get_sheet_url(sheet_id, table), headers=headers)
+         if res.status_code != 304:
+            content = res.content
+            meta = dict(meta or dict(), etag=res.headers.get('ETag'))
+         write_cache(sheet_id, table, content, meta)
+         record['status'] = res.status_code
+      record['bytes'] = len(content)
+   return content
+
+
+def download_sheets(jobs, max_workers=C.FETCH_WORKERS, ttl=C.CACHE_TTL):
+   # jobs: iterable of (sheet_id, table), fetched all at once
+   jobs = list(dict.fromkeys(jobs))
+   if not jobs:
+      return dict()
+   with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+      contents = pool.map(lambda job: fetch_sheet(*job, ttl=ttl), jobs)
+      return dict(zip(jobs, contents))
+
+
+# ============ #
+# Offline mode #
+# ============ #
+def get_offline_dir():
+   return os.environ.get(C.ENV_OFFLINE_DIR) or C.OFFLINE_DIR
+
+
+def read_snapshot(root, sheet_id, table):
+   with timed('fetch', sheet=sheet_id[:8], table=table) as record:
+      with open(get_cache_path(sheet_id, table, 'csv', root), 'rb') as f:
+         content = f.read()
+      record.update(status='offline', bytes=len(content))
+   return content
+
+
+def write_snapshot(root, contents):
+   for (sheet_id, table), content in contents.items():
+      write_atomic(get_cache_path(sheet_id, table, 'csv', root), content)
+
+
+def fetch_sheets(jobs, max_workers=C.FETCH_WORKERS, ttl=C.CACHE_TTL):
+   # Same contents either way, from Google or from the offline snapshot
+   offline_dir = get_offline_dir()
+   if offline_dir is None:
+      return download_sheets(jobs, max_workers, ttl)
+   return {
+      job: read_snapshot(offline_dir, *job)
+      for job in dict.fromkeys(jobs)
+   }
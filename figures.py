@@ -0,0 +1,277 @@
+import math
+from plotly import graph_objects as go
+from plotly import express as px
+from plotly.subplots import make_subplots
+import consts as C
+from ledger import slice_cube
+from balance import get_monthly_net
+from stats import STATS, get_monthly, get_stat
+from timing import timed
+from utils import get_color_map
+
+
+# ===== #
+# Cache #
+# ===== #
+# Figures and the aggregates behind them, per data version and keyed by
+# every widget value they depend on; a rerun only builds what changed
+MEMOS = dict()
+MEMO_SIZE = 256
+
+
+def get_memo(version, key, build, *args):
+   if version not in MEMOS:
+      MEMOS.clear()
+      MEMOS[version] = dict()
+   memos = MEMOS[version]
+   with timed('figure', name=str(key[0]), is_cached=key in memos):
+      if key not in memos:
+         if len(memos) >= MEMO_SIZE:
+            memos.pop(next(iter(memos)))
+         memos[key] = build(*args)
+   return memos[key]
+
+
+# =============== #
+# Private helpers #
+# =============== #
+def get_pie(df, col_group):
+   # go.Pie straight away, rather than a px.pie built only for .data[0]
+   color_map = get_color_map(col_group)
+   pct = df[C.COL_AMOUNT] / df[C.COL_AMOUNT].sum() * 1E2
+   return go.Pie(
+      labels=df[col_group],
+      values=df[C.COL_AMOUNT],
+      marker=dict(colors=[
+         color_map.get(group, 'lightgray') for group in df[col_group]
+      ]),
+      customdata=pct.map('{:.1f}'.format),
+      hovertemplate='%{label}=%{customdata}%<extra></extra>'
+   )
+
+
+def add_overlays(fig, df_monthly, col_group, overlays, window):
+   # One line per statistic and group; deltas and yearly figures are far
+   # off the monthly scale, so they get an axis of their own
+   color_map = get_color_map(col_group) if col_group else dict()
+   dashes = ['solid', 'dot', 'dash', 'dashdot']
+   for idx, name in enumerate(overlays):
+      label, is_secondary, _ = STATS[name]
+      df_stat = get_stat(df_monthly, name, window, col_group)
+      for group in df_stat.columns:
+         fig.add_trace(go.Scatter(
+            name=f'{window}個月{label}' if col_group is None
+            else f'{window}個月{label}：{group}',
+            mode='lines',
+            x=df_stat.index,
+            y=df_stat[group],
+            yaxis='y2' if is_secondary else 'y',
+            line=dict(
+               width=6 if col_group is None else 3,
+               dash=dashes[idx % len(dashes)],
+               color=color_map.get(group)
+            )
+         ))
+   if any(STATS[name][1] for name in overlays):
+      fig.update_layout(yaxis2=dict(
+         overlaying='y',
+         side='right',
+         showgrid=False,
+         tickfont_size=C.FONT_SIZE_TICK
+      ))
+
+
+# ======= #
+# Figures #
+# ======= #
+def build_fig_monthly(
+   df_cube, col_group, is_by_group, overlays=('mean',), window=3
+):
+   df_monthly_total = slice_cube(df_cube, C.COL_MM)
+   max_amount_in_ban7 = math.ceil(df_monthly_total[C.COL_AMOUNT].max() / 1E4)
+   fig_monthly_total = go.Figure()
+   if not is_by_group:
+      fig_monthly_total.add_trace(go.Scatter(
+         name=C.COL_AMOUNT,
+         mode='markers',
+         x=df_monthly_total[C.COL_MM],
+         y=df_monthly_total[C.COL_AMOUNT],
+         marker=dict(
+            size=16
+         )
+      ))
+   else:
+      fig_monthly_total = px.histogram(
+         data_frame=slice_cube(df_cube, [C.COL_MM, col_group]),
+         x=C.COL_MM,
+         y=C.COL_AMOUNT,
+         color=col_group,
+         color_discrete_map=get_color_map(col_group)
+      )
+   fig_monthly_total.update_xaxes(
+      title_text=C.COL_MM,
+      showgrid=False,
+      tickfont_size=C.FONT_SIZE_TICK
+   )
+   fig_monthly_total.update_yaxes(
+      title_text='萬',
+      gridwidth=0.1,
+      tickmode='array',
+      tickvals=[i * 1E4 for i in range(max_amount_in_ban7 + 1)],
+      ticktext=list(range(max_amount_in_ban7 + 1)),
+      tickfont_size=C.FONT_SIZE_TICK,
+      tickwidth=10
+   )
+   # After the ticks above, which are for the amounts axis only
+   add_overlays(
+      fig_monthly_total,
+      get_monthly(df_cube, col_group if is_by_group else None),
+      col_group if is_by_group else None,
+      overlays,
+      window
+   )
+   return fig_monthly_total
+
+
+def build_fig_recent(df_cube, col_group, ym_start, ym_end):
+   df_monthly_total = slice_cube(df_cube, C.COL_MM)
+   df_monthly_total = df_monthly_total[
+      df_monthly_total[C.COL_MM].between(ym_start, ym_end)
+   ]
+   fig_recent_months = make_subplots(
+      rows=1, cols=len(df_monthly_total),
+      specs=[[{'type': 'pie'} for _ in range(len(df_monthly_total))]],
+      subplot_titles=[
+         f'<b>{ym}</b><br>${total}'
+         for ym, total in zip(
+            df_monthly_total[C.COL_MM], df_monthly_total[C.COL_AMOUNT]
+         )
+      ]
+   )
+   for col_idx, ym in enumerate(df_monthly_total[C.COL_MM]):
+      df_by_group = slice_cube(df_cube, col_group, {C.COL_MM: ym})
+      fig_recent_months.add_trace(
+         get_pie(df_by_group, col_group),
+         row=1, col=(col_idx + 1)
+      )
+   fig_recent_months.update_traces(
+      textposition='inside',
+      textinfo='label+value',
+      textfont_size=C.FONT_SIZE_TEXT,
+      insidetextorientation='horizontal'
+   )
+   fig_recent_months.update_layout(
+      hoverlabel=dict(font_size=C.FONT_SIZE_HOVER)
+   )
+   return fig_recent_months
+
+
+def build_fig_month(df_cube, col_group, ym_target):
+   df_by_group = slice_cube(df_cube, col_group, {C.COL_MM: ym_target})
+   df_by_group.sort_values(
+      by=C.COL_AMOUNT,
+      ascending=False,
+      inplace=True,
+      ignore_index=True
+   )
+   num_classes = df_by_group[col_group].shape[0]
+
+   fig_target_month = make_subplots(
+      rows=1, cols=num_classes,
+      specs=[[{'type': 'pie'} for _ in range(num_classes)]],
+      subplot_titles=[
+         f'<b>{cls}</b><br>${total}'
+         for cls, total in zip(
+            df_by_group[col_group], df_by_group[C.COL_AMOUNT]
+         )
+      ]
+   )
+   for idx, cls in enumerate(df_by_group[col_group]):
+      df_by_tag = slice_cube(
+         df_cube, C.COL_TAG, {C.COL_MM: ym_target, col_group: cls}
+      )
+      fig_target_month.add_trace(
+         go.Pie(
+            labels=df_by_tag[C.COL_TAG],
+            values=df_by_tag[C.COL_AMOUNT],
+            textposition='inside',
+            textinfo='label+value',
+            textfont_size=C.FONT_SIZE_TEXT,
+            insidetextorientation='horizontal',
+            hoverinfo='label+percent',
+            marker=dict(
+               colors=px.colors.qualitative.Antique
+            ),
+            showlegend=False
+         ),
+         row=1, col=(idx + 1)
+      )
+   fig_target_month.update_layout(
+      hoverlabel=dict(font_size=C.FONT_SIZE_HOVER)
+   )
+   return fig_target_month
+
+
+# ======= #
+# Balance #
+# ======= #
+def build_df_net(df_cube, df_cube_income):
+   return get_monthly_net(
+      slice_cube(df_cube, C.COL_MM),
+      slice_cube(df_cube_income, C.COL_MM)
+   )
+
+
+def build_fig_income(df_cube_income, df_net):
+   # Income stacked by kind, with what is left after spending on top
+   df_by_kind = slice_cube(df_cube_income, [C.COL_MM, C.COL_KIND])
+   color_map = get_color_map(C.COL_KIND)
+   fig_income = go.Figure()
+   for kind, df_kind in df_by_kind.groupby(C.COL_KIND, observed=True):
+      fig_income.add_trace(go.Bar(
+         name=kind,
+         x=df_kind[C.COL_MM].astype(str),
+         y=df_kind[C.COL_AMOUNT],
+         marker_color=color_map.get(kind, 'lightgray')
+      ))
+   fig_income.add_trace(go.Scatter(
+      name=C.COL_NET,
+      mode='lines+markers',
+      x=df_net[C.COL_MM],
+      y=df_net[C.COL_NET],
+      line=dict(
+         width=4
+      )
+   ))
+   fig_income.update_layout(
+      barmode='stack',
+      hoverlabel=dict(font_size=C.FONT_SIZE_HOVER)
+   )
+   fig_income.update_xaxes(
+      title_text=C.COL_MM,
+      type='category',
+      categoryorder='category ascending',
+      showgrid=False,
+      tickfont_size=C.FONT_SIZE_TICK
+   )
+   fig_income.update_yaxes(
+      tickfont_size=C.FONT_SIZE_TICK
+   )
+   return fig_income
+
+
+def build_fig_kinds(df_cube_income, ym_target):
+   df_by_kind = slice_cube(
+      df_cube_income, C.COL_KIND, {C.COL_MM: ym_target}
+   )
+   fig_kinds = go.Figure(get_pie(df_by_kind, C.COL_KIND))
+   fig_kinds.update_traces(
+      textposition='inside',
+      textinfo='label+value',
+      textfont_size=C.FONT_SIZE_TEXT,
+      insidetextorientation='horizontal'
+   )
+   fig_kinds.update_layout(
+      hoverlabel=dict(font_size=C.FONT_SIZE_HOVER)
+   )
+   return fig_kinds
@@ -0,0 +1,114 @@
+import argparse
+import sys
+import pandas as pd
+import consts as C
+
+
+# =============== #
+# Private helpers #
+# =============== #
+COL_MEMO = '備註'
+COL_NOTE = '註記'
+
+
+def rm_pattern(sr, pattern, to_char=''):
+   return sr.str.replace(pattern, to_char, regex=True)
+
+
+def to_int_amount(sr):
+   sr = rm_pattern(sr, r'TWD|,|\s', '')
+   return pd.to_numeric(sr, errors='coerce').round().astype('Int64')
+
+
+# ============ #
+# Bank exports #
+# ============ #
+def clean_citi(df):
+   df = df.dropna(subset=[C.COL_AMOUNT]).copy()
+   df[C.COL_DATE] = df[C.COL_DATE].str.strip()
+   df[C.COL_STORE] = rm_pattern(df[C.COL_STORE], r'\s*－\s*', ' ')
+   df[C.COL_STORE] = rm_pattern(df[C.COL_STORE], r'\s*(TAIPEI|TW|CITY)\s*')
+   df[C.COL_AMOUNT] = to_int_amount(df[C.COL_AMOUNT])
+   return df
+
+
+def clean_ctbc(df):
+   df = df.dropna(subset=[C.COL_AMOUNT, COL_NOTE]).copy()
+   df[C.COL_DATE] = df[C.COL_DATE].str.strip()
+   # Wallet top-ups keep the wallet name in front of the note
+   is_wallet = df[COL_MEMO].isin(['街口', '悠遊付'])
+   df[C.COL_STORE] = df[COL_NOTE].where(
+      ~is_wallet, df[COL_MEMO] + df[COL_NOTE]
+   )
+   # The app finds card bills and 孝親/房租 in the item, as in the sheet
+   df[C.COL_ITEM] = df[COL_NOTE]
+   df[C.COL_AMOUNT] = to_int_amount(df[C.COL_AMOUNT])
+   return df
+
+
+# Column positions follow the banks' CSV exports (no header row)
+EXPORTS = {
+   'citi': dict(
+      usecols=[0, 2, 3],
+      names=[C.COL_DATE, C.COL_STORE, C.COL_AMOUNT],
+      encoding='utf-8',
+      clean=clean_citi,
+      cols=C.COLS_SHEET_CITI
+   ),
+   'ctbc': dict(
+      usecols=[0, 2, 5, 7],
+      names=[C.COL_DATE, C.COL_AMOUNT, COL_MEMO, COL_NOTE],
+      encoding='big5',
+      clean=clean_ctbc,
+      cols=C.COLS_SHEET_CTBC
+   )
+}
+
+
+def import_export(bank, path_in, file_out, chunksize=C.IMPORT_CHUNKSIZE):
+   # Streams the export chunk by chunk into rows shaped like the bank's
+   # sheet tab, so memory stays bounded by chunksize
+   export = EXPORTS[bank]
+   num_rows = 0
+   with pd.read_csv(
+      path_in,
+      header=None,
+      usecols=export['usecols'],
+      names=export['names'],
+      dtype=str,
+      encoding=export['encoding'],
+      chunksize=chunksize
+   ) as reader:
+      for idx, df_chunk in enumerate(reader):
+         df_chunk = export['clean'](df_chunk)
+         df_chunk = df_chunk.reindex(columns=export['cols'])
+         df_chunk.to_csv(file_out, header=(idx == 0), index=False)
+         num_rows += len(df_chunk)
+   return num_rows
+
+
+# ================ #
+# Command line app #
+# ================ #
+def main(argv=None):
+   parser = argparse.ArgumentParser(
+      description='Convert bank CSV exports into sheet rows'
+   )
+   parser.add_argument('bank', choices=sorted(EXPORTS))
+   parser.add_argument('path_in', help='CSV exported from the bank')
+   parser.add_argument('-o', '--output', help='defaults to stdout')
+   parser.add_argument('--chunksize', type=int, default=C.IMPORT_CHUNKSIZE)
+   args = parser.parse_args(argv)
+
+   if args.output is None:
+      num_rows = import_export(
+         args.bank, args.path_in, sys.stdout, args.chunksize
+      )
+   else:
+      with open(args.output, 'w', encoding='utf-8', newline='') as f:
+         num_rows = import_export(args.bank, args.path_in, f, args.chunksize)
+   print(f'{num_rows} rows imported', file=sys.stderr)
+
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,402 @@
+import os
+import re
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import consts as C
+from fetch import fetch_sheets, get_offline_dir
+from timing import timed
+from utils import (
+   load_df_from_content,
+   concat_tables,
+   classify_stores,
+   tags_to_classes,
+   get_rules_hash
+)
+from sources import (
+   ADAPTERS,
+   get_adapter_hash,
+   get_adapter_jobs,
+   get_keywords_hash,
+   normalize_table,
+   TOPUP_KEYWORDS
+)
+from balance import parse_bank_rows, get_income_rules_hash
+
+
+# =============== #
+# Private helpers #
+# =============== #
+def get_ledger_version(contents):
+   # Changes whenever a tab's content or any classification rule changes
+   sha1 = hashlib.sha1(get_rules_hash().encode('utf-8'))
+   sha1.update(get_income_rules_hash().encode('utf-8'))
+   sha1.update(json.dumps(C.COLS_NORMALIZED).encode('utf-8'))
+   sha1.update(get_keywords_hash().encode('utf-8'))
+   for adapter in ADAPTERS.values():
+      sha1.update(get_adapter_hash(adapter).encode('utf-8'))
+   for (sheet_id, table), content in sorted(contents.items()):
+      sha1.update(f'{sheet_id}/{table}'.encode('utf-8'))
+      sha1.update(hashlib.sha256(content).digest())
+   return sha1.hexdigest()
+
+
+def infer_spending(df):
+   df[C.COL_AMOUNT] = df[C.COL_AMOUNT].astype('int32')
+   is_topup = df[C.COL_ITEM].str.contains(
+      '|'.join(map(re.escape, TOPUP_KEYWORDS))
+   )
+   df.loc[is_topup, C.COL_FREQ] = C.FREQ_TOPUP
+
+   df_store = classify_stores(df[C.COL_STORE])
+   df[C.COL_STORE] = df_store[C.COL_STORE]
+   df[C.COL_TAG] = df[C.COL_TAG].where(
+      df[C.COL_TAG] != '', df_store[C.COL_TAG]
+   )
+   df[C.COL_CLASS] = tags_to_classes(df[C.COL_TAG])
+   df[C.COL_FREQ] = df[C.COL_FREQ].replace('', C.FREQ_ONCE)
+   return df
+
+
+def to_category(sr, categories, ordered=False):
+   # Values typed by hand outside the known lists are kept, sorted last
+   extra = sorted(set(sr.dropna().unique()) - set(categories))
+   return pd.Categorical(sr, categories=categories + extra, ordered=ordered)
+
+
+def set_ledger_dtypes(df):
+   for col, categories in (
+      (C.COL_TAG, C.TAGS),
+      (C.COL_CLASS, C.CLASSES),
+      (C.COL_FREQ, C.FREQS),
+      (C.COL_PAY, C.PAYS),
+      (C.COL_SOURCE, list(ADAPTERS)),
+      (C.COL_STORE, [])
+   ):
+      df[col] = to_category(df[col], categories)
+   return set_date_columns(df)
+
+
+def set_date_columns(df):
+   # C.COLS_DERIVED: the month period is labelled once per month, not per row
+   date = pd.to_datetime(df[C.COL_DATE])
+   df[C.COL_DATE] = date
+   codes, months = pd.factorize(date.dt.to_period('M'), sort=True)
+   df[C.COL_MM] = pd.Categorical.from_codes(
+      codes,
+      categories=months.strftime('%Y/%m'),
+      ordered=True
+   )
+   df[C.COL_DD] = date.dt.day.astype('int8')
+   df[C.COL_YM] = (date.dt.year * 100 + date.dt.month).astype('int32')
+   return df
+
+
+# ===================== #
+# Incremental ingestion #
+# ===================== #
+def get_state_path(sheet_id, table):
+   return os.path.join(C.CACHE_DIR, 'ledger', sheet_id, f'{table}.pkl')
+
+
+def load_state(sheet_id, table):
+   try:
+      return pd.read_pickle(get_state_path(sheet_id, table))
+   except Exception:
+      # Missing or unreadable state only means a full rebuild
+      return None
+
+
+def save_state(sheet_id, table, state):
+   path = get_state_path(sheet_id, table)
+   os.makedirs(os.path.dirname(path), exist_ok=True)
+   pd.to_pickle(state, f'{path}.tmp')
+   os.replace(f'{path}.tmp', path)
+
+
+def hash_rows(df):
+   return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def ingest_table(adapter, table, content):
+   # Rows already ingested are reused as long as they are unchanged, so
+   # only the rows appended since the last load are parsed and tagged
+   sheet_id = adapter['sheet_id']
+   rules_hash = get_rules_hash()
+   adapter_hash = get_adapter_hash(adapter)
+   keywords_hash = get_keywords_hash()
+   income_hash = get_income_rules_hash()
+   sha256 = hashlib.sha256(content).hexdigest()
+   state = load_state(sheet_id, table)
+   key = (
+      rules_hash, adapter_hash, keywords_hash, income_hash,
+      C.COLS_NORMALIZED
+   )
+   is_stale = state is not None and key != (
+      state['rules'], state.get('adapter'), state.get('keywords'),
+      state.get('income'), state['cols']
+   )
+   if is_stale:
+      state = None
+   if state is not None and state['sha256'] == sha256:
+      return state['df'], state['sides']
+
+   fields = dict(source=adapter['source'], table=table)
+   with timed('parse', **fields) as record:
+      df_raw = load_df_from_content(content, adapter['cols'])
+      record['rows'] = len(df_raw)
+   row_hashes = hash_rows(df_raw)
+   num_rows = 0
+   dfs = []
+   dfs_side = {name: [] for name in SIDE_TABLES}
+   is_appended = state is not None and np.array_equal(
+      row_hashes[:len(state['row_hashes'])], state['row_hashes']
+   )
+   if is_appended:
+      num_rows = len(state['row_hashes'])
+      dfs.append(state['df'])
+      for name, df_side in state['sides'].items():
+         dfs_side[name].append(df_side)
+   if num_rows < len(df_raw):
+      # Deposits and the like come from the same new rows
+      for name, df_side in parse_bank_rows(
+         df_raw.iloc[num_rows:], adapter, table
+      ).items():
+         dfs_side[name].append(df_side)
+      with timed('normalize', **fields) as record:
+         df_new = normalize_table(
+            df_raw.iloc[num_rows:].copy(), adapter, table
+         )
+         record['rows'] = len(df_new)
+      with timed('classify', **fields, rows=len(df_new)):
+         df_new = infer_spending(df_new)
+      df_new[C.COL_SOURCE] = adapter['source']
+      dfs.append(df_new)
+
+   df = concat_tables(dfs, C.COLS_NORMALIZED)
+   sides = {
+      name: concat_side_tables(name, dfs_side[name])
+      for name in SIDE_TABLES
+   }
+   save_state(sheet_id, table, dict(
+      rules=rules_hash,
+      adapter=adapter_hash,
+      keywords=keywords_hash,
+      income=income_hash,
+      cols=C.COLS_NORMALIZED,
+      sha256=sha256,
+      row_hashes=row_hashes,
+      df=df,
+      sides=sides
+   ))
+   return df, sides
+
+
+# ============== #
+# Columnar store #
+# ============== #
+def get_store_path(name, root=None):
+   return os.path.join(root or C.CACHE_DIR, 'store', name)
+
+
+def get_store_root():
+   # An offline snapshot that carries its own store is read as is
+   offline_dir = get_offline_dir()
+   if offline_dir is not None:
+      if os.path.exists(get_store_path('manifest.json', offline_dir)):
+         return offline_dir
+   return C.CACHE_DIR
+
+
+def get_partition_name(ym):
+   return f"{ym.replace('/', '-')}.parquet"
+
+
+def load_manifest(root=None):
+   try:
+      path = get_store_path('manifest.json', root)
+      with open(path, encoding='utf-8') as f:
+         return json.load(f)
+   except (OSError, ValueError):
+      return dict(version=None, partitions=dict())
+
+
+def save_store(df, version, root=None):
+   # One parquet file per month, rewritten only when its rows changed
+   manifest = load_manifest(root)
+   partitions = dict()
+   os.makedirs(get_store_path('', root), exist_ok=True)
+   for ym, df_month in df.groupby(C.COL_MM, sort=True, observed=True):
+      name = get_partition_name(ym)
+      partitions[name] = str(
+         pd.util.hash_pandas_object(df_month, index=False).sum()
+      )
+      if manifest['partitions'].get(name) != partitions[name]:
+         path = get_store_path(name, root)
+         df_month.to_parquet(f'{path}.tmp', index=False)
+         os.replace(f'{path}.tmp', path)
+   for name in set(manifest['partitions']) - set(partitions):
+      os.remove(get_store_path(name, root))
+
+   path = get_store_path('manifest.json', root)
+   with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+      json.dump(dict(version=version, partitions=partitions), f)
+   os.replace(f'{path}.tmp', path)
+
+
+# Tables of the bank rows that are not spending, ingested along with the
+# ledger (see parse_bank_rows): name -> columns
+SIDE_TABLES = dict(
+   income=C.COLS_INCOME,
+   payments=C.COLS_PAYMENT
+)
+
+
+def concat_side_tables(name, dfs):
+   # Empty parts are left out, so their object columns do not override
+   # the dtypes (e.g. categorical kinds) of the others
+   return concat_tables(
+      [df for df in dfs if not df.empty], SIDE_TABLES[name]
+   ).sort_values(by=C.COL_DATE, kind='stable', ignore_index=True)
+
+
+def save_table(name, df, root=None):
+   path = get_store_path(f'{name}.parquet', root)
+   os.makedirs(os.path.dirname(path), exist_ok=True)
+   df.to_parquet(f'{path}.tmp', index=False)
+   os.replace(f'{path}.tmp', path)
+
+
+def load_table(name, root=None):
+   try:
+      df = pd.read_parquet(
+         get_store_path(f'{name}.parquet', root), memory_map=True
+      )
+   except OSError:
+      df = pd.DataFrame(columns=SIDE_TABLES[name])
+   return set_date_columns(df)
+
+
+def decode_dictionaries(table):
+   # Partitions written in different runs may differ in their categories,
+   # hence in their dictionary index width, and concat_tables needs equal
+   # schemas: categoricals are read back as plain values and rebuilt by
+   # set_ledger_dtypes
+   return table.cast(pa.schema([
+      field.with_type(field.type.value_type)
+      if pa.types.is_dictionary(field.type) else field
+      for field in table.schema
+   ]))
+
+
+def read_store(ym_start=None, ym_end=None, root=None):
+   # Only the partitions within [ym_start, ym_end] are memory-mapped
+   name_start = get_partition_name(ym_start) if ym_start else ''
+   name_end = get_partition_name(ym_end) if ym_end else '~'
+   names = [
+      name for name in sorted(load_manifest(root)['partitions'])
+      if name_start <= name <= name_end
+   ]
+   if not names:
+      return pd.DataFrame(columns=C.COLS_NORMALIZED)
+   return pa.concat_tables([
+      decode_dictionaries(
+         pq.read_table(get_store_path(name, root), memory_map=True)
+      )
+      for name in names
+   ]).to_pandas()
+
+
+# ============== #
+# Public helpers #
+# ============== #
+def build_ledger(contents, root=None):
+   # contents: {(sheet_id, table): csv bytes} for every adapter tab
+   version = get_ledger_version(contents)
+   if load_manifest(root)['version'] == version:
+      with timed('read_store') as record:
+         df = set_ledger_dtypes(read_store(root=root))
+         record['rows'] = len(df)
+      return df, version
+
+   # Tabs are independent, so they are normalized side by side; map keeps
+   # the adapter order, hence the row order, stable
+   jobs = [
+      (adapter, yy, contents[adapter['sheet_id'], yy])
+      for adapter in ADAPTERS.values()
+      for yy in adapter['tables']
+   ]
+   with ThreadPoolExecutor(max_workers=C.FETCH_WORKERS) as pool:
+      results = list(pool.map(lambda job: ingest_table(*job), jobs))
+   with timed('save_store') as record:
+      df = concat_tables([df for df, _ in results], C.COLS_NORMALIZED)
+      df = set_ledger_dtypes(df)
+      df.sort_values(
+         by=C.COL_DATE,
+         kind='stable',
+         inplace=True,
+         ignore_index=True
+      )
+      save_store(df, version, root)
+      record['rows'] = len(df)
+   for name in SIDE_TABLES:
+      with timed(name) as record:
+         df_side = concat_side_tables(
+            name, [sides[name] for _, sides in results]
+         )
+         save_table(name, df_side, root)
+         record['rows'] = len(df_side)
+   return df, version
+
+
+def load_ledger(ttl=C.CACHE_TTL):
+   root = get_store_root()
+   if root != C.CACHE_DIR:
+      with timed('read_store', offline=True) as record:
+         df = set_ledger_dtypes(read_store(root=root))
+         record['rows'] = len(df)
+      return df, load_manifest(root)['version']
+   return build_ledger(fetch_sheets(get_adapter_jobs(), ttl=ttl))
+
+
+# ============== #
+# Aggregate cube #
+# ============== #
+COLS_CUBE = [C.COL_MM, C.COL_CLASS, C.COL_TAG, C.COL_FREQ, C.COL_PAY]
+COLS_CUBE_INCOME = [C.COL_MM, C.COL_KIND, C.COL_SOURCE]
+CUBES = dict()
+
+
+def build_cube(df, cols=COLS_CUBE):
+   return df.groupby(
+      by=cols,
+      as_index=False,
+      observed=True
+   )[C.COL_AMOUNT].agg(**{C.COL_AMOUNT: 'sum', C.COL_COUNT: 'count'})
+
+
+def get_cube(df, version, cols=COLS_CUBE):
+   # Built once per data version, every chart slices this instead of df
+   if version not in CUBES:
+      CUBES.clear()
+      CUBES[version] = dict()
+   cubes = CUBES[version]
+   if tuple(cols) not in cubes:
+      with timed('aggregate', rows=len(df)) as record:
+         cubes[tuple(cols)] = build_cube(df, cols)
+         record['cells'] = len(cubes[tuple(cols)])
+   return cubes[tuple(cols)]
+
+
+def slice_cube(cube, by, filters=None):
+   for col, value in (filters or dict()).items():
+      cube = cube[cube[col] == value]
+   return cube.groupby(
+      by=by,
+      as_index=False,
+      observed=True
+   )[[C.COL_AMOUNT, C.COL_COUNT]].sum()
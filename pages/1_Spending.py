@@ -1,21 +1,24 @@
 import streamlit as st
-import math
-import pandas as pd
-from plotly import graph_objects as go
-from plotly import express as px
-from plotly.subplots import make_subplots
 import consts as C
-from utils import (
-   get_df_cash,
-   get_df_ctbc,
-   get_df_citi,
-   get_df_tsib,
-   parse_spending_from_ctbc,
-   trim_store,
-   store_to_tag,
-   tag_to_class,
-   get_color_map
-)
+from data import (
+   get_ledger,
+   get_payments,
+   show_data_age,
+   start_run,
+   show_debug
+)
+from ledger import get_cube, slice_cube
+from query import get_index, filter_ledger
+from reconcile import reconcile
+from recurring import detect_recurring
+from stats import STATS, get_stat_label
+from figures import (
+   get_memo,
+   build_fig_monthly,
+   build_fig_recent,
+   build_fig_month
+)
+from timing import timed
 
 
 # =========== #
@@ -33,228 +36,143 @@ st.set_page_config(
 # Spending #
 # ======== #
 st.header(':shopping_trolley: 開')
-df_out = pd.DataFrame()
-
-# === Cash === #
-df_cash = get_df_cash(C.SHEET_ID_CASH)
-df_out = df_out.append(df_cash, ignore_index=True)
-
-# === Bank === #
-df_ctbc = get_df_ctbc(C.SHEET_ID_BANK_CTBC, tables=['2022', '2023'])
-df_ctbc_spending = parse_spending_from_ctbc(df_ctbc)
-df_out = df_out.append(df_ctbc_spending, ignore_index=True)
-
-# === Credit card === #
-df_citi = get_df_citi(C.SHEET_ID_CARD_CITI, tables=['2022', '2023'])
-df_out = df_out.append(df_citi, ignore_index=True)
-
-df_tsib = get_df_tsib(C.SHEET_ID_CARD_TSIB, tables=['2022', '2023'])
-df_out = df_out.append(df_tsib, ignore_index=True)
-
-# === Infer tag, class, freq === #
-df_out[C.COL_DD] = df_out[C.COL_DD].astype('int32')
-df_out[C.COL_STORE] = df_out[C.COL_STORE].transform(trim_store)
-df_out[C.COL_AMOUNT] = df_out[C.COL_AMOUNT].astype('int32')
-df_out.loc[df_out[C.COL_ITEM].str.contains('儲值'), C.COL_FREQ] = C.FREQ_TOPUP
-
-df_out.loc[df_out[C.COL_TAG] == '', C.COL_TAG] = (
-   df_out.loc[df_out[C.COL_TAG] == '', C.COL_STORE]
-).transform(store_to_tag)
-df_out[C.COL_CLASS] = df_out[C.COL_TAG].transform(tag_to_class)
-df_out[C.COL_FREQ] = df_out[C.COL_FREQ].replace('', C.FREQ_ONCE)
-df_out.sort_values(
-   by=[C.COL_MM, C.COL_DD],
-   inplace=True,
-   ignore_index=True
-)
-
-
-# === Monthly summary === #
-st.subheader('攏總')
-df_monthly_total = df_out.groupby(
-   by=C.COL_MM,
-   as_index=False
-)[C.COL_AMOUNT].agg('sum')
-max_amount_in_ban7 = math.ceil(df_monthly_total[C.COL_AMOUNT].max() / 1E4)
-fig_monthly_total = go.Figure()
-is_by_group = st.checkbox(label='分組')
+profiler = start_run()
+df_out, data_version, loaded_at, load_timings = get_ledger()
+show_data_age(loaded_at)
+df_cube = get_cube(df_out, data_version)
+df_monthly_total = get_memo(
+   data_version, ('monthly_total',), slice_cube, df_cube, C.COL_MM
+)
+ym_list = df_monthly_total[C.COL_MM].tolist()
 col_group = st.selectbox(
    label='照',
    options=[C.COL_CLASS, C.COL_FREQ, C.COL_PAY],
 )
-if not is_by_group:
-   fig_monthly_total.add_trace(go.Scatter(
-      name=C.COL_AMOUNT,
-      mode='markers',
-      x=df_monthly_total[C.COL_MM],
-      y=df_monthly_total[C.COL_AMOUNT],
-      marker=dict(
-         size=16
-      )
-   ))
-   fig_monthly_total.add_trace(go.Scatter(
-      name='三個月平均',
-      mode='lines',
-      x=df_monthly_total[C.COL_MM],
-      y=df_monthly_total[C.COL_AMOUNT].rolling(3, min_periods=1).mean(),
-      line=dict(
-         width=6
-      )
-   ))
-else:
-   fig_monthly_total = px.histogram(
-      data_frame=df_out,
-      x=C.COL_MM,
-      y=C.COL_AMOUNT,
-      color=col_group,
-      color_discrete_map=get_color_map(col_group)
-   )
-fig_monthly_total.update_xaxes(
-   title_text=C.COL_MM,
-   showgrid=False,
-   tickfont_size=C.FONT_SIZE_TICK
-)
-fig_monthly_total.update_yaxes(
-   title_text='萬',
-   gridwidth=0.1,
-   tickmode='array',
-   tickvals=[i * 1E4 for i in range(max_amount_in_ban7 + 1)],
-   ticktext=list(range(max_amount_in_ban7 + 1)),
-   tickfont_size=C.FONT_SIZE_TICK,
-   tickwidth=10
+# Only the selected section is computed; st.tabs would run them all
+section = st.radio(
+   label='看',
+   options=['攏總', '最近', '孤月', '對帳', '定期'],
+   horizontal=True,
+   label_visibility='collapsed'
 )
-st.plotly_chart(fig_monthly_total, use_container_width=True)
 
 
-# === Recent months === #
-st.subheader('最近')
-ym_list = df_out[C.COL_MM].dropna().unique().tolist()
-num_months_total = len(ym_list)
-ym_idx_end = num_months_total - 1
-ym_idx_start = max(ym_idx_end - 2, 0)
-
-ym_start, ym_end = st.select_slider(
-   label='範圍',
-   options=ym_list,
-   value=(ym_list[ym_idx_start], ym_list[ym_idx_end])
-)
-ym_idx_start, ym_idx_end = map(
-   lambda ym: ym_list.index(ym), [ym_start, ym_end]
-)
-num_months_focus = ym_idx_end - ym_idx_start + 1
-ym_indices = list(range(ym_idx_start, (ym_idx_end + 1)))
-fig_subtitles = [
-   f'<b>{ym}</b><br>${total}'
-   for ym, total in zip(
-      df_monthly_total[C.COL_MM], df_monthly_total[C.COL_AMOUNT]
+# === Monthly summary === #
+if section == '攏總':
+   st.subheader('攏總')
+   is_by_group = st.checkbox(label='分組')
+   col_overlays, col_window = st.columns([3, 1])
+   overlays = col_overlays.multiselect(
+      label='疊',
+      options=list(STATS),
+      default=['mean'],
+      format_func=get_stat_label
    )
-]
-fig_recent_months = make_subplots(
-   rows=1, cols=num_months_focus,
-   specs=[[{'type': 'pie'} for _ in ym_indices]],
-   subplot_titles=[fig_subtitles[idx] for idx in ym_indices]
-)
-for col_idx, ym_idx in enumerate(ym_indices):
-   df_curr_month = df_out.query(f"{C.COL_MM} == '{ym_list[ym_idx]}'")
-   df_by_group = df_curr_month.groupby(
-      by=col_group,
-      as_index=False
-   )[C.COL_AMOUNT].agg('sum')
-   df_by_group[C.COL_PCT] = (
-      df_by_group[C.COL_AMOUNT] / df_by_group[C.COL_AMOUNT].sum() * 1E2
-   ).transform(lambda pct: f'{pct:.1f}')
-
-   fig_by_group = px.pie(
-      df_by_group,
-      names=col_group,
-      values=C.COL_AMOUNT,
-      color=col_group,
-      color_discrete_map=get_color_map(col_group),
-      hover_data=[C.COL_PCT]
+   window = col_window.selectbox(label='月數', options=C.STATS_WINDOWS)
+   fig_monthly_total = get_memo(
+      data_version,
+      ('攏總', col_group if is_by_group else None, tuple(overlays), window),
+      build_fig_monthly, df_cube, col_group, is_by_group, overlays, window
    )
-   fig_by_group.update_traces(
-      hovertemplate='%{customdata[0][1]}=%{customdata[0][0]}%<extra></extra>'
+   st.plotly_chart(fig_monthly_total, use_container_width=True)
+
+
+# === Recent months === #
+if section == '最近':
+   st.subheader('最近')
+   ym_start, ym_end = st.select_slider(
+      label='範圍',
+      options=ym_list,
+      value=(ym_list[max(len(ym_list) - 3, 0)], ym_list[-1])
    )
-   fig_recent_months.add_trace(
-      fig_by_group.data[0],
-      row=1, col=(col_idx + 1)
+   fig_recent_months = get_memo(
+      data_version,
+      ('最近', col_group, ym_start, ym_end),
+      build_fig_recent, df_cube, col_group, ym_start, ym_end
    )
-fig_recent_months.update_traces(
-   textposition='inside',
-   textinfo='label+value',
-   textfont_size=C.FONT_SIZE_TEXT,
-   insidetextorientation='horizontal'
-)
-fig_recent_months.update_layout(
-   hoverlabel=dict(font_size=C.FONT_SIZE_HOVER)
-)
-st.plotly_chart(fig_recent_months, use_container_width=True)
+   st.plotly_chart(fig_recent_months, use_container_width=True)
 
 
 # === Single month === #
-st.subheader('孤月')
-ym_target = st.select_slider(
-   label=C.COL_MM,
-   options=ym_list,
-   value=ym_list[ym_idx_end]
-)
-df_target_month = df_out.query(f'{C.COL_MM} == @ym_target')
-df_by_group = df_target_month.groupby(
-   by=col_group,
-   as_index=False
-)[C.COL_AMOUNT].agg('sum')
-df_by_group.sort_values(
-   by=C.COL_AMOUNT,
-   ascending=False,
-   inplace=True,
-   ignore_index=True
-)
-num_classes = df_by_group[col_group].shape[0]
-
-fig_target_month = make_subplots(
-   rows=1, cols=num_classes,
-   specs=[[{'type': 'pie'} for _ in range(num_classes)]],
-   subplot_titles=[
-      f'<b>{cls}</b><br>${total}'
-      for cls, total in zip(df_by_group[col_group], df_by_group[C.COL_AMOUNT])
-   ]
-)
-for idx, cls in enumerate(df_by_group[col_group]):
-   df_target_group = df_target_month.query(f'{col_group} == @cls')
-   df_by_tag = df_target_group.groupby(
-      by=C.COL_TAG,
-      as_index=False
-   )[C.COL_AMOUNT].agg('sum')
-   fig_target_month.add_trace(
-      go.Pie(
-         labels=df_by_tag[C.COL_TAG],
-         values=df_by_tag[C.COL_AMOUNT],
-         textposition='inside',
-         textinfo='label+value',
-         textfont_size=C.FONT_SIZE_TEXT,
-         insidetextorientation='horizontal',
-         hoverinfo='label+percent',
-         marker=dict(
-            colors=px.colors.qualitative.Antique
-         ),
-         showlegend=False
-      ),
-      row=1, col=(idx + 1)
+if section == '孤月':
+   st.subheader('孤月')
+   ym_target = st.select_slider(
+      label=C.COL_MM,
+      options=ym_list,
+      value=ym_list[-1]
    )
-fig_target_month.update_layout(
-   hoverlabel=dict(font_size=C.FONT_SIZE_HOVER)
-)
-st.plotly_chart(fig_target_month, use_container_width=True)
+   fig_target_month = get_memo(
+      data_version,
+      ('孤月', col_group, ym_target),
+      build_fig_month, df_cube, col_group, ym_target
+   )
+   st.plotly_chart(fig_target_month, use_container_width=True)
 
 
 # === Customized query === #
-ex_group = df_by_group[col_group][0]
-query = st.text_input(
-   label='家己揣',
-   value=f"{C.COL_MM} == '{ym_target}' & {col_group} == '{ex_group}'"
-)
-df_result = df_out.query(query)
-if not df_result.empty:
-   st.table(df_result.drop(
-      columns=[col for col in C.COLS_TYPE if col != col_group])
+if section == '孤月':
+   df_by_group = slice_cube(df_cube, col_group, {C.COL_MM: ym_target})
+   ex_group = df_by_group.loc[df_by_group[C.COL_AMOUNT].idxmax(), col_group]
+   query = st.text_input(
+      label='家己揣',
+      value=f'{C.COL_MM}={ym_target} {col_group}={ex_group}',
+      help=f'{C.COL_MM}=2023/01..2023/03 {C.COL_CLASS}=食外,消遣 '
+      f'{C.COL_STORE}~全家 {C.COL_AMOUNT}=100..500'
+   )
+   try:
+      with timed('query') as record:
+         df_result = filter_ledger(
+            df_out, get_index(df_out, data_version), query
+         )
+         record['rows'] = len(df_result)
+   except ValueError as err:
+      st.error(err)
+      df_result = df_out.iloc[:0]
+   if not df_result.empty:
+      cols_hidden = [C.COL_DATE, C.COL_YM] + [
+         col for col in C.COLS_TYPE if col != col_group
+      ]
+      st.table(df_result.drop(columns=cols_hidden))
+
+
+# === Reconciliation === #
+if section == '對帳':
+   st.subheader('對帳')
+   st.caption(
+      '帳單是每張卡一期的總數，無設結帳日就算規個月；繳款愛仝款額，'
+      f'佇結帳了後 {C.RECONCILE_BILL_DAYS} 工內。'
+      f'儲值佮別本簿仔內底仝款額、差 {C.RECONCILE_TOPUP_DAYS} 工內的，'
+      '看做算兩擺。'
    )
+   matches = get_memo(
+      data_version, ('對帳',),
+      reconcile, df_out, get_payments(data_version)
+   )
+   col_bills, col_unpaid, col_unbilled, col_twins = st.columns(4)
+   col_bills.metric('對著的帳單', len(matches['bills']))
+   col_unpaid.metric('無對著的繳款', len(matches['unmatched_payments']))
+   col_unbilled.metric('無對著的帳單', len(matches['unmatched_statements']))
+   col_twins.metric('儲值算兩擺', len(matches['topup_twins']))
+   for label, key in (
+      ('無對著的繳款', 'unmatched_payments'),
+      ('無對著的帳單', 'unmatched_statements'),
+      ('儲值算兩擺', 'topup_twins'),
+      ('無對著的儲值', 'unmatched_topups')
+   ):
+      if not matches[key].empty:
+         st.caption(label)
+         st.dataframe(matches[key], use_container_width=True)
+
+
+# === Recurring expenses === #
+if section == '定期':
+   st.subheader('定期')
+   df_recurring = get_memo(
+      data_version, ('定期',), detect_recurring, df_out
+   )
+   st.caption(f'{len(df_recurring)} 間店看起來是定期的開銷')
+   st.dataframe(df_recurring, use_container_width=True)
+
+
+# === Debug === #
+show_debug(load_timings, profiler)
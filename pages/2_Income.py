@@ -1,7 +1,18 @@
 import streamlit as st
 import consts as C
-from utils import (
-   get_df_ctbc
+from data import (
+   get_ledger,
+   get_income,
+   show_data_age,
+   start_run,
+   show_debug
+)
+from ledger import get_cube, COLS_CUBE_INCOME
+from figures import (
+   get_memo,
+   build_df_net,
+   build_fig_income,
+   build_fig_kinds
 )
 
 
@@ -20,4 +31,49 @@ st.set_page_config(
 # Income #
 # ====== #
 st.header(':moneybag: 儉')
-st.markdown(':construction: :construction_worker: :construction:')
+profiler = start_run()
+df_out, data_version, loaded_at, load_timings = get_ledger()
+show_data_age(loaded_at)
+df_income = get_income(data_version)
+df_cube = get_cube(df_out, data_version)
+df_cube_income = get_cube(df_income, data_version, COLS_CUBE_INCOME)
+df_net = get_memo(
+   data_version, ('net',), build_df_net, df_cube, df_cube_income
+)
+
+
+# === Monthly summary === #
+st.subheader('攏總')
+fig_income = get_memo(
+   data_version, ('入',), build_fig_income, df_cube_income, df_net
+)
+st.plotly_chart(fig_income, use_container_width=True)
+
+
+# === Single month === #
+st.subheader('孤月')
+ym_list = df_net[C.COL_MM].tolist()
+ym_target = st.select_slider(
+   label=C.COL_MM,
+   options=ym_list,
+   value=ym_list[-1]
+)
+row = df_net.set_index(C.COL_MM).loc[ym_target]
+for col, label in zip(st.columns(3), [C.COL_INCOME, C.COL_SPENT, C.COL_NET]):
+   col.metric(label=label, value=f'${row[label]:,}')
+
+if ym_target in df_income[C.COL_MM].cat.categories:
+   fig_kinds = get_memo(
+      data_version, ('款', ym_target), build_fig_kinds,
+      df_cube_income, ym_target
+   )
+   st.plotly_chart(fig_kinds, use_container_width=True)
+   st.table(
+      df_income[df_income[C.COL_MM] == ym_target][
+         [C.COL_DD, C.COL_STORE, C.COL_ITEM, C.COL_AMOUNT, C.COL_KIND]
+      ]
+   )
+
+
+# === Debug === #
+show_debug(load_timings, profiler)
@@ -0,0 +1,136 @@
+import re
+import numpy as np
+import pandas as pd
+import consts as C
+
+
+# =============== #
+# Filter language #
+# =============== #
+# Terms are separated by spaces (or '&'), e.g.
+#    月=2023/01..2023/03 類=食外,消遣 店~全家 額=100..500
+#    工=2023/01/05..2023/02/10
+COLS_FILTER_CATEGORY = [
+   C.COL_CLASS, C.COL_TAG, C.COL_FREQ, C.COL_PAY, C.COL_SOURCE
+]
+PATTERN_TERM = re.compile(r'(.+?)(=|~)(.+)')
+
+
+def parse_range(value, to_lo, to_hi=None):
+   lo, sep, hi = value.partition('..')
+   if not sep:
+      hi = lo
+   try:
+      return (
+         to_lo(lo) if lo else -np.inf,
+         (to_hi or to_lo)(hi) if hi else np.inf
+      )
+   except ValueError:
+      raise ValueError(f'範圍袂使：{value}') from None
+
+
+def to_ym_key(ym, mm_default=1):
+   # '2023/01' -> 202301, a bare year covers its whole range
+   yy, _, mm = ym.partition('/')
+   return int(yy) * 100 + int(mm or mm_default)
+
+
+def to_ym_key_end(ym):
+   return to_ym_key(ym, mm_default=12)
+
+
+def to_day_key(day):
+   # '2023/01/05' -> days since epoch
+   return int(np.datetime64(pd.Timestamp(day), 'D').astype('int64'))
+
+
+def parse_filter(text):
+   filters = dict()
+   for term in text.replace('&', ' ').split():
+      match = PATTERN_TERM.fullmatch(term)
+      if match is None:
+         raise ValueError(f'看無條件：{term}')
+      col, op, value = match.groups()
+      if col == C.COL_STORE:
+         filters.setdefault(col, []).append((op, value))
+      elif op != '=':
+         raise ValueError(f'{col} 干焦會使用 =：{term}')
+      elif col == C.COL_MM:
+         filters[col] = parse_range(value, to_ym_key, to_ym_key_end)
+      elif col == C.COL_DATE:
+         filters[col] = parse_range(value, to_day_key)
+      elif col == C.COL_AMOUNT:
+         filters[col] = parse_range(value, float)
+      elif col in COLS_FILTER_CATEGORY:
+         filters[col] = value.split(',')
+      else:
+         raise ValueError(f'無這个欄位：{col}')
+   return filters
+
+
+# ===== #
+# Index #
+# ===== #
+INDEXES = dict()
+
+
+def build_index(df):
+   # The ledger is sorted by date, so a month or date range is a row range
+   index = dict(
+      ym=df[C.COL_YM].to_numpy(),
+      day=df[C.COL_DATE].to_numpy().astype('datetime64[D]').astype('int64'),
+      amount=df[C.COL_AMOUNT].to_numpy(),
+      store_codes=df[C.COL_STORE].cat.codes.to_numpy(),
+      stores=df[C.COL_STORE].cat.categories.astype(str),
+      bitmaps=dict()
+   )
+   for col in COLS_FILTER_CATEGORY:
+      codes = df[col].cat.codes.to_numpy()
+      index['bitmaps'][col] = {
+         cat: codes == code
+         for code, cat in enumerate(df[col].cat.categories)
+      }
+   return index
+
+
+def get_index(df, version):
+   if version not in INDEXES:
+      INDEXES.clear()
+      INDEXES[version] = build_index(df)
+   return INDEXES[version]
+
+
+def filter_ledger(df, index, text):
+   filters = parse_filter(text)
+   start, end = 0, len(index['ym'])
+   for col, key in ((C.COL_MM, 'ym'), (C.COL_DATE, 'day')):
+      if col in filters:
+         lo, hi = filters[col]
+         start = max(start, np.searchsorted(index[key], lo, side='left'))
+         end = min(end, np.searchsorted(index[key], hi, side='right'))
+
+   mask = np.ones(max(end - start, 0), dtype=bool)
+   for col in COLS_FILTER_CATEGORY:
+      if col in filters:
+         bitmaps = index['bitmaps'][col]
+         mask_col = np.zeros_like(mask)
+         for value in filters[col]:
+            if value in bitmaps:
+               mask_col |= bitmaps[value][start:end]
+         mask &= mask_col
+   if C.COL_AMOUNT in filters:
+      lo, hi = filters[C.COL_AMOUNT]
+      amount = index['amount'][start:end]
+      mask &= (amount >= lo) & (amount <= hi)
+   for op, value in filters.get(C.COL_STORE, []):
+      # Matched against the distinct store names, not every row
+      stores = index['stores']
+      if op == '~':
+         is_match = stores.str.contains(value, regex=False)
+      else:
+         is_match = stores == value
+      mask &= np.isin(
+         index['store_codes'][start:end],
+         np.flatnonzero(is_match)
+      )
+   return df.iloc[np.flatnonzero(mask) + start]
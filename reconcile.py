@@ -0,0 +1,166 @@
+import re
+import numpy as np
+import pandas as pd
+import consts as C
+from utils import CREDIT_BILL_KEYWORDS, concat_tables
+from sources import ADAPTERS
+
+
+# =============== #
+# Private helpers #
+# =============== #
+def get_bill_pattern():
+   return '|'.join(map(re.escape, CREDIT_BILL_KEYWORDS))
+
+
+def items_to_cards(sr):
+   # Bank item -> source of the card it pays, '' for cards without a sheet
+   conds, sources = [], []
+   for adapter in ADAPTERS.values():
+      if adapter['bill_keywords']:
+         conds.append(sr.str.contains(
+            '|'.join(map(re.escape, adapter['bill_keywords']))
+         ).to_numpy(bool))
+         sources.append(adapter['source'])
+   return np.select(conds, sources, default='')
+
+
+def get_days(sr):
+   # Days since the epoch, whatever the datetime resolution
+   return sr.to_numpy().astype('datetime64[D]').astype('int64')
+
+
+def join_within(df_left, df_right, keys, lo, hi, cols_differ=()):
+   # Hash join on keys plus a day bucket, so only rows a window apart are
+   # ever paired: rows of the same amount years apart never meet.
+   # cols_differ: columns that must not be equal on both sides.
+   # Returns (left label, right label, gap in days), each row used once,
+   # closest pairs first
+   width = max(hi - lo, 1)
+   left = pd.DataFrame({
+      'left': df_left.index,
+      'day': get_days(df_left[C.COL_DATE]),
+      **{key: df_left[key].to_numpy() for key in keys},
+      **{f'{col}_left': df_left[col].astype(str) for col in cols_differ}
+   })
+   right = pd.DataFrame({
+      'right': df_right.index,
+      'day_right': get_days(df_right[C.COL_DATE]),
+      **{key: df_right[key].to_numpy() for key in keys},
+      **{f'{col}_right': df_right[col].astype(str) for col in cols_differ}
+   })
+   left['bucket'] = (left['day'] + lo) // width
+   right['bucket'] = right['day_right'] // width
+   # A window spans at most two buckets, so each left row probes both
+   left = pd.concat(
+      [left, left.assign(bucket=left['bucket'] + 1)],
+      ignore_index=True
+   )
+   pairs = left.merge(right, on=keys + ['bucket'])
+   pairs['gap'] = pairs['day_right'] - pairs['day']
+   pairs = pairs[pairs['gap'].between(lo, hi)]
+   for col in cols_differ:
+      pairs = pairs[pairs[f'{col}_left'] != pairs[f'{col}_right']]
+   pairs = pairs.iloc[np.argsort(pairs['gap'].abs().to_numpy(), kind='stable')]
+   # Each round keeps every left row's closest free right row, so rows that
+   # lost theirs to a closer pair fall back to the next one
+   matched = [pairs.iloc[:0]]
+   while not pairs.empty:
+      best = pairs.drop_duplicates('left').drop_duplicates('right')
+      matched.append(best)
+      is_taken = pairs['left'].isin(best['left'])
+      is_taken |= pairs['right'].isin(best['right'])
+      pairs = pairs[~is_taken]
+   return pd.concat(matched)[['left', 'right', 'gap']]
+
+
+# ========== #
+# Card bills #
+# ========== #
+def get_statements(df):
+   # Total of each card's statement cycle, dated on its closing day. A cycle
+   # is the calendar month unless the adapter sets a statement_day
+   dfs = []
+   for adapter in ADAPTERS.values():
+      if not adapter['bill_keywords']:
+         continue
+      day = adapter['statement_day']
+      date = df.loc[df[C.COL_SOURCE] == adapter['source'], C.COL_DATE]
+      # The day after closing starts the next cycle
+      cycle = (date - pd.Timedelta(days=day)).dt.to_period('M') + 1
+      closing = cycle.dt.start_time + pd.Timedelta(days=day - 1)
+      df_statement = df.loc[date.index, [C.COL_AMOUNT]].groupby(
+         closing.dt.normalize().rename(C.COL_DATE)
+      )[C.COL_AMOUNT].sum().reset_index()
+      df_statement[C.COL_SOURCE] = adapter['source']
+      dfs.append(df_statement)
+   df_statements = concat_tables(
+      dfs, [C.COL_DATE, C.COL_AMOUNT, C.COL_SOURCE]
+   )
+   df_statements[C.COL_MM] = df_statements[C.COL_DATE].dt.strftime('%Y/%m')
+   df_statements[C.COL_AMOUNT] = df_statements[C.COL_AMOUNT].astype('int64')
+   return df_statements[
+      [C.COL_SOURCE, C.COL_MM, C.COL_AMOUNT, C.COL_DATE]
+   ].reset_index(drop=True)
+
+
+def match_bills(df, df_payments, days=C.RECONCILE_BILL_DAYS):
+   # -> (matched, unmatched payments, unmatched statements)
+   df_statements = get_statements(df)
+   pairs = join_within(
+      df_statements, df_payments, [C.COL_SOURCE, C.COL_AMOUNT], 0, days
+   )
+   df_matched = df_statements.loc[pairs['left']].reset_index(drop=True)
+   df_matched[f'{C.COL_DATE}{C.COL_MATCH}'] = df_payments.loc[
+      pairs['right'], C.COL_DATE
+   ].to_numpy()
+   df_matched[C.COL_GAP] = pairs['gap'].to_numpy()
+   return (
+      df_matched,
+      df_payments.drop(index=pairs['right']),
+      df_statements.drop(index=pairs['left'])
+   )
+
+
+# ======= #
+# Top-ups #
+# ======= #
+def match_topups(df, days=C.RECONCILE_TOPUP_DAYS):
+   # A wallet top-up (儲值) charged in one sheet that also shows up as a
+   # same-amount row in another sheet within days: likely counted twice
+   # -> (pairs, top-ups without a twin)
+   df_topups = df[df[C.COL_FREQ] == C.FREQ_TOPUP]
+   df_others = df[df[C.COL_FREQ] != C.FREQ_TOPUP]
+   # A same-amount row of the same sheet is a separate spend, so it is
+   # never a candidate: the top-up may still have a twin elsewhere
+   pairs = join_within(
+      df_topups, df_others, [C.COL_AMOUNT], -days, days,
+      cols_differ=[C.COL_SOURCE]
+   )
+   cols = [C.COL_DATE, C.COL_STORE, C.COL_ITEM, C.COL_AMOUNT, C.COL_SOURCE]
+   df_twin = df_others.loc[pairs['right'], cols].reset_index(drop=True)
+   df_pairs = pd.concat(
+      [
+         df_topups.loc[pairs['left'], cols].reset_index(drop=True),
+         df_twin.add_suffix(C.COL_MATCH)
+      ],
+      axis=1
+   )
+   df_pairs[C.COL_GAP] = pairs['gap'].to_numpy()
+   return df_pairs, df_topups.drop(index=pairs['left'])[cols]
+
+
+# ============== #
+# Public helpers #
+# ============== #
+def reconcile(df, df_payments):
+   # Everything the 對帳 section shows, in one pass over the ledger
+   df_bills, df_unpaid, df_unbilled = match_bills(df, df_payments)
+   df_twins, df_topups = match_topups(df)
+   return dict(
+      bills=df_bills,
+      unmatched_payments=df_unpaid,
+      unmatched_statements=df_unbilled,
+      topup_twins=df_twins,
+      unmatched_topups=df_topups
+   )
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import consts as C
+from reconcile import get_days
+
+
+# =============== #
+# Recurring rules #
+# =============== #
+# (frequency, shortest gap, longest gap in days, fewest visits, fixed amount)
+# tried in order, the first whose band holds enough of a store's gaps wins
+RECURRING_RULES = [
+   (C.FREQ_SUB, 26, 35, 3, True),
+   (C.FREQ_MONTH, 26, 35, 3, False),
+   (C.FREQ_BIMONTH, 55, 66, 3, False),
+   (C.FREQ_YEAR, 350, 380, 3, False)
+]
+
+
+# =============== #
+# Private helpers #
+# =============== #
+def get_store_days(df):
+   # One row per store and day, sorted by store then day, with the gap to
+   # the store's previous day (NaN on each store's first day)
+   df_days = pd.DataFrame({
+      'store': df[C.COL_STORE].cat.codes.to_numpy(),
+      'day': get_days(df[C.COL_DATE]),
+      C.COL_AMOUNT: df[C.COL_AMOUNT].to_numpy('int64')
+   }).groupby(['store', 'day'], as_index=False, sort=True)[C.COL_AMOUNT].sum()
+   store = df_days['store'].to_numpy()
+   day = df_days['day'].to_numpy()
+   gap = np.full(len(df_days), np.nan)
+   is_same = store[1:] == store[:-1]
+   gap[1:][is_same] = (day[1:] - day[:-1])[is_same]
+   df_days[C.COL_GAP] = gap
+   return df_days
+
+
+# ============== #
+# Public helpers #
+# ============== #
+def detect_recurring(df):
+   # -> one row per store that looks periodic, with the suggested frequency.
+   # Only rows still on the default C.FREQ_ONCE are looked at, frequencies
+   # set by hand or by keyword are left alone
+   df = df[(df[C.COL_FREQ] == C.FREQ_ONCE) & (df[C.COL_STORE] != '')]
+   df_days = get_store_days(df)
+   by_store = df_days.groupby('store', sort=True)
+   df_stores = by_store.agg(**{
+      C.COL_COUNT: ('day', 'size'),
+      C.COL_GAP: (C.COL_GAP, 'median'),
+      C.COL_AMOUNT: (C.COL_AMOUNT, 'median'),
+      'amount_min': (C.COL_AMOUNT, 'min'),
+      'amount_max': (C.COL_AMOUNT, 'max'),
+      'day_last': ('day', 'max')
+   })
+   spread = df_stores['amount_max'] - df_stores['amount_min']
+   is_fixed = spread.le(
+      df_stores[C.COL_AMOUNT] * C.RECURRING_AMOUNT_SPREAD
+   ).to_numpy()
+
+   conds = []
+   for _, lo, hi, min_count, is_fixed_amount in RECURRING_RULES:
+      # Share of a store's gaps within the band, one pass per rule
+      share = df_days[C.COL_GAP].between(lo, hi).groupby(
+         df_days['store'], sort=True
+      ).sum() / (df_stores[C.COL_COUNT] - 1).clip(lower=1)
+      cond = (df_stores[C.COL_COUNT] >= min_count) & (
+         share >= C.RECURRING_SHARE
+      )
+      if is_fixed_amount:
+         cond = cond & is_fixed
+      conds.append(cond.to_numpy(bool))
+   df_stores[C.COL_FREQ] = np.select(
+      conds, [freq for freq, *_ in RECURRING_RULES], default=''
+   )
+
+   df_stores = df_stores[df_stores[C.COL_FREQ] != '']
+   categories = df[C.COL_STORE].cat.categories
+   return pd.DataFrame({
+      C.COL_STORE: categories[df_stores.index.to_numpy()],
+      C.COL_FREQ: df_stores[C.COL_FREQ].to_numpy(),
+      C.COL_COUNT: df_stores[C.COL_COUNT].to_numpy(),
+      C.COL_GAP: df_stores[C.COL_GAP].to_numpy(),
+      C.COL_AMOUNT: df_stores[C.COL_AMOUNT].to_numpy(),
+      C.COL_DATE: df_stores['day_last'].to_numpy().astype('datetime64[D]')
+   })
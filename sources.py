@@ -0,0 +1,188 @@
+import re
+import json
+import hashlib
+import pandas as pd
+import consts as C
+from utils import CREDIT_BILL_KEYWORDS, to_amount
+
+
+# =============== #
+# Source adapters #
+# =============== #
+# One adapter per sheet. Adding a card only takes a register_adapter call
+# here (plus its sheet id and columns in consts), every adapter goes through
+# the same normalize_table pipeline below.
+ADAPTERS = dict()
+
+
+def register_adapter(
+   source,
+   sheet_id,
+   tables,
+   cols,
+   date_format=None,
+   pay_default=C.PAY_CARD,
+   pay_digit_keywords=(),
+   is_positive_only=False,
+   filter_rows=None,
+   col_deposit=None,
+   bill_keywords=(),
+   statement_day=0
+):
+   # date_format: to_datetime format of the date column, None if the sheet
+   #    has separate month and day columns and the tab name is the year
+   # filter_rows: optional df -> df hook for source-specific rows
+   # col_deposit: column of money coming in, read by the income engine
+   # bill_keywords: words of a bank item paying this card's bill, read by
+   #    the reconciliation
+   # statement_day: day of month a card statement closes, 0 for the last
+   #    day of the calendar month
+   ADAPTERS[source] = dict(
+      source=source,
+      sheet_id=sheet_id,
+      tables=list(tables),
+      cols=list(cols),
+      date_format=date_format,
+      pay_default=pay_default,
+      pay_digit_keywords=list(pay_digit_keywords),
+      is_positive_only=is_positive_only,
+      filter_rows=filter_rows,
+      col_deposit=col_deposit,
+      bill_keywords=list(bill_keywords),
+      statement_day=statement_day
+   )
+   return ADAPTERS[source]
+
+
+def get_adapter_hash(adapter):
+   # Hooks are hashed by name, so editing one needs a version bump by hand
+   spec = {
+      key: getattr(value, '__qualname__', value)
+      for key, value in adapter.items()
+   }
+   return hashlib.sha1(
+      json.dumps(spec, ensure_ascii=False, sort_keys=True).encode('utf-8')
+   ).hexdigest()[:16]
+
+
+def get_adapter_jobs():
+   return [
+      (adapter['sheet_id'], yy)
+      for adapter in ADAPTERS.values()
+      for yy in adapter['tables']
+   ]
+
+
+# ====================== #
+# Normalization pipeline #
+# ====================== #
+def parse_dates(df, date_format, yy):
+   # One vectorized to_datetime per tab, unparsable dates become NaT
+   if date_format is None:
+      return pd.to_datetime(
+         pd.DataFrame(dict(
+            year=int(yy),
+            month=pd.to_numeric(df[C.COL_MM], errors='coerce'),
+            day=pd.to_numeric(df[C.COL_DD], errors='coerce')
+         )),
+         errors='coerce'
+      )
+   return pd.to_datetime(
+      df[C.COL_DATE].astype(str).str.strip(),
+      format=date_format,
+      errors='coerce'
+   )
+
+
+def normalize_table(df, adapter, yy):
+   # Sheet rows -> C.COLS_LEDGER, without any store classification yet
+   df[C.COL_DATE] = parse_dates(df, adapter['date_format'], yy)
+   # Rows without a date (e.g. blank rows below the data) have no month
+   df = df.dropna(subset=[C.COL_DATE])
+   df[C.COL_AMOUNT] = to_amount(df[C.COL_AMOUNT])
+   if adapter['is_positive_only']:
+      df = df[df[C.COL_AMOUNT] > 0]
+   if adapter['filter_rows'] is not None:
+      df = adapter['filter_rows'](df)
+
+   df = df[C.COLS_LEDGER].copy()
+   if adapter['pay_digit_keywords']:
+      is_digit = df[C.COL_STORE].str.contains(
+         '|'.join(map(re.escape, adapter['pay_digit_keywords']))
+      )
+      df.loc[is_digit, C.COL_PAY] = C.PAY_DIGIT
+   df[C.COL_PAY] = df[C.COL_PAY].replace('', adapter['pay_default'])
+   return df
+
+
+# ======== #
+# Adapters #
+# ======== #
+# Bank items paid every month, tagged by keyword
+CTBC_ITEM_TAGS = [('孝親', C.TAG_FAMILY), ('房租', C.TAG_SLEEP)]
+# Items topping up a wallet, whatever the sheet
+TOPUP_KEYWORDS = ['儲值']
+
+
+def get_keywords_hash():
+   # Every keyword list the row filters and frequency rules depend on, so
+   # that editing one invalidates the ingested tabs like a rule change
+   keywords = [CREDIT_BILL_KEYWORDS, CTBC_ITEM_TAGS, TOPUP_KEYWORDS]
+   return hashlib.sha1(
+      json.dumps(keywords, ensure_ascii=False).encode('utf-8')
+   ).hexdigest()[:16]
+
+
+def filter_ctbc_spending(df):
+   # The bank sheet also holds ATM withdrawals and card bills, which are
+   # already counted in the cash and card sheets
+   is_credit_bill = df[C.COL_ITEM].str.contains(
+      '|'.join(map(re.escape, CREDIT_BILL_KEYWORDS))
+   )
+   df = df[(df[C.COL_STORE] != 'ＡＴＭ') & ~is_credit_bill].copy()
+   for kw, tag in CTBC_ITEM_TAGS:
+      df.loc[
+         df[C.COL_ITEM].str.contains(kw),
+         [C.COL_TAG, C.COL_FREQ]
+      ] = tag, C.FREQ_MONTH
+   return df
+
+
+register_adapter(
+   source=C.SRC_CASH,
+   sheet_id=C.SHEET_ID_CASH,
+   tables=C.YY_LIST,
+   cols=C.COLS_SHEET_CASH,
+   pay_default=C.PAY_CASH
+)
+register_adapter(
+   source=C.SRC_CTBC,
+   sheet_id=C.SHEET_ID_BANK_CTBC,
+   tables=C.YY_LIST_CARD,
+   cols=C.COLS_SHEET_CTBC,
+   date_format='%Y/%m/%d',
+   pay_default=C.PAY_DIGIT,
+   is_positive_only=True,
+   filter_rows=filter_ctbc_spending,
+   col_deposit=C.COL_DEPOSIT
+)
+# 連加：Line Pay
+register_adapter(
+   source=C.SRC_CITI,
+   sheet_id=C.SHEET_ID_CARD_CITI,
+   tables=C.YY_LIST_CARD,
+   cols=C.COLS_SHEET_CITI,
+   date_format='%d/%m/%Y',
+   pay_digit_keywords=('街口', '連加'),
+   is_positive_only=True,
+   bill_keywords=('花旗',)
+)
+register_adapter(
+   source=C.SRC_TSIB,
+   sheet_id=C.SHEET_ID_CARD_TSIB,
+   tables=C.YY_LIST_CARD,
+   cols=C.COLS_SHEET_TSIB,
+   date_format='%Y/%m/%d',
+   pay_digit_keywords=('街口', '連加'),
+   bill_keywords=('台新',)
+)
@@ -0,0 +1,102 @@
+import pandas as pd
+import consts as C
+from ledger import slice_cube
+from timing import timed
+
+
+# ========== #
+# Statistics #
+# ========== #
+# Each takes the monthly frame (one column per group) and a window in
+# months, and only looks back: a month's value depends on earlier months
+def get_rolling_mean(df, window):
+   return df.rolling(window, min_periods=1).mean()
+
+
+def get_rolling_median(df, window):
+   return df.rolling(window, min_periods=1).median()
+
+
+def get_yoy_delta(df, window):
+   return get_rolling_mean(df, window).diff(12)
+
+
+def get_run_rate(df, window):
+   # What a year costs at the recent pace
+   return get_rolling_mean(df, window) * 12
+
+
+# name -> (label, drawn on the secondary axis, statistic)
+STATS = dict(
+   mean=('平均', False, get_rolling_mean),
+   median=('中位', False, get_rolling_median),
+   yoy=('比舊年', True, get_yoy_delta),
+   run_rate=('一年', True, get_run_rate)
+)
+# Months a statistic looks back at most, besides its window
+STATS_LOOKBACK = 12
+
+
+def get_stat_label(name):
+   return STATS[name][0]
+
+
+# ============== #
+# Monthly series #
+# ============== #
+def get_monthly(df_cube, col_group=None):
+   # Months x groups (or the total alone), months without rows are zeros
+   # so that windows and the year before count calendar months
+   if col_group is None:
+      df = slice_cube(df_cube, C.COL_MM).set_index(C.COL_MM)[[C.COL_AMOUNT]]
+   else:
+      df = slice_cube(df_cube, [C.COL_MM, col_group]).pivot(
+         index=C.COL_MM, columns=col_group, values=C.COL_AMOUNT
+      )
+   df.index = df.index.astype(str)
+   df.columns = df.columns.astype(str)
+   months = pd.period_range(
+      df.index.min().replace('/', '-'),
+      df.index.max().replace('/', '-'),
+      freq='M'
+   ).strftime('%Y/%m')
+   return df.reindex(months).fillna(0).astype('int64')
+
+
+# ================= #
+# Incremental cache #
+# ================= #
+# (col_group, name, window) -> (monthly totals, values) of the closed
+# months, i.e. all but the latest one. Kept across data versions: a refresh
+# only recomputes from the first month whose totals changed, which is
+# usually the current one
+STATS_CACHE = dict()
+
+
+def get_first_change(df_old, df_new):
+   num = min(len(df_old), len(df_new))
+   if num == 0 or not df_old.columns.equals(df_new.columns):
+      return 0
+   if not df_old.index[:num].equals(df_new.index[:num]):
+      return 0
+   is_changed = (
+      df_old.iloc[:num].to_numpy() != df_new.iloc[:num].to_numpy()
+   ).any(axis=1)
+   return int(is_changed.argmax()) if is_changed.any() else num
+
+
+def get_stat(df_monthly, name, window, col_group=None):
+   key = (col_group, name, window)
+   df_closed = df_monthly.iloc[:-1]
+   df_totals, df_values = STATS_CACHE.get(key, (df_closed.iloc[:0], None))
+   start = get_first_change(df_totals, df_closed)
+   with timed('stats', name=name, months=len(df_monthly) - start):
+      # Only the months from start on, plus what their windows look back at
+      lookback = max(start - window - STATS_LOOKBACK + 1, 0)
+      df_new = STATS[name][2](df_monthly.iloc[lookback:], window)
+      df_values = pd.concat([
+         df_values.iloc[:start] if df_values is not None else None,
+         df_new.iloc[start - lookback:]
+      ])
+   STATS_CACHE[key] = (df_closed, df_values.iloc[:len(df_closed)])
+   return df_values
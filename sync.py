@@ -0,0 +1,48 @@
+import os
+import sys
+import argparse
+import consts as C
+from fetch import download_sheets, write_snapshot
+from ledger import build_ledger
+from sources import get_adapter_jobs
+
+
+# ================ #
+# Command line app #
+# ================ #
+def sync(root, is_store=False):
+   # Every configured sheet and year in one parallel pass, always online
+   contents = download_sheets(get_adapter_jobs(), ttl=0)
+   write_snapshot(root, contents)
+   if is_store:
+      build_ledger(contents, root)
+   return contents
+
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(
+      description='Snapshot every sheet tab for offline mode'
+   )
+   parser.add_argument(
+      'root', nargs='?',
+      default=os.environ.get(C.ENV_OFFLINE_DIR) or C.OFFLINE_DIR,
+      help=f'snapshot directory, defaults to ${C.ENV_OFFLINE_DIR}'
+   )
+   parser.add_argument(
+      '--store', action='store_true',
+      help='also write the columnar ledger store, read instead of the tabs'
+   )
+   args = parser.parse_args(argv)
+   if args.root is None:
+      parser.error(f'no snapshot directory nor ${C.ENV_OFFLINE_DIR}')
+
+   contents = sync(args.root, args.store)
+   num_bytes = sum(map(len, contents.values()))
+   print(
+      f'{len(contents)} tabs ({num_bytes / 2 ** 20:.1f}MB) -> {args.root}',
+      file=sys.stderr
+   )
+
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,36 @@
+import io
+import consts as C
+from importer import import_export
+from utils import load_df_from_content
+from sources import ADAPTERS, normalize_table
+
+
+# ============ #
+# Bank exports #
+# ============ #
+def write_ctbc_export(path, rows):
+   # date, _, amount, _, _, memo, _, note: the bank's column positions
+   lines = [
+      f'{date},,"{amount}",,,{memo},,{note}'
+      for date, amount, memo, note in rows
+   ]
+   path.write_bytes('\n'.join(lines).encode('big5'))
+
+
+def test_ctbc_card_bill_is_kept_out_of_spending(tmp_path):
+   path = tmp_path / 'ctbc.csv'
+   write_ctbc_export(path, [
+      ('2023/02/01', '1,000', '', '花旗銀行信用卡'),
+      ('2023/02/02', '300', '街口', '早餐店'),
+      ('2023/02/03', '5,000', '', '孝親')
+   ])
+   buf = io.StringIO()
+   assert import_export('ctbc', path, buf) == 3
+
+   df = load_df_from_content(
+      buf.getvalue().encode('utf-8'), C.COLS_SHEET_CTBC
+   )
+   assert df[C.COL_ITEM].tolist() == ['花旗銀行信用卡', '早餐店', '孝親']
+   df = normalize_table(df, ADAPTERS[C.SRC_CTBC], '2023')
+   assert df[C.COL_STORE].tolist() == ['街口早餐店', '孝親']
+   assert df[C.COL_FREQ].tolist() == ['', C.FREQ_MONTH]
@@ -0,0 +1,88 @@
+import pandas as pd
+import consts as C
+from ledger import set_ledger_dtypes, save_store, read_store, ingest_table
+from sources import ADAPTERS
+
+
+# ============== #
+# Columnar store #
+# ============== #
+def make_ledger(stores, months):
+   rows = [
+      dict(
+         **{C.COL_DATE: f'{ym}/{idx % 28 + 1:02d}'},
+         **{C.COL_STORE: store, C.COL_ITEM: '', C.COL_AMOUNT: idx + 1},
+         **{C.COL_TAG: C.TAG_DEFAULT, C.COL_FREQ: C.FREQ_ONCE},
+         **{C.COL_PAY: C.PAY_CASH, C.COL_CLASS: C.CLS_DEFAULT},
+         **{C.COL_SOURCE: C.SRC_CASH}
+      )
+      for ym in months
+      for idx, store in enumerate(stores)
+   ]
+   df = pd.DataFrame(rows)
+   df[C.COL_DATE] = pd.to_datetime(df[C.COL_DATE], format='%Y/%m/%d')
+   df[C.COL_AMOUNT] = df[C.COL_AMOUNT].astype('int32')
+   df = set_ledger_dtypes(df[C.COLS_NORMALIZED])
+   return df.sort_values(by=C.COL_DATE, kind='stable', ignore_index=True)
+
+
+def test_read_store_partitions_from_different_runs(tmp_path):
+   # Appending 300 stores to one month widens the store categories past
+   # int8 in the rewritten partition only
+   stores = [f'店{idx}' for idx in range(20)]
+   save_store(make_ledger(stores, ['2023/01', '2023/02']), 'v1', tmp_path)
+   df = pd.concat([
+      make_ledger(stores, ['2023/01']),
+      make_ledger(stores + [f'新{idx}' for idx in range(300)], ['2023/02'])
+   ], ignore_index=True)
+   df = set_ledger_dtypes(df[C.COLS_NORMALIZED].astype({
+      col: str for col in C.COLS_TYPE + [C.COL_STORE, C.COL_TAG]
+   }))
+   save_store(df, 'v2', tmp_path)
+
+   df_read = set_ledger_dtypes(read_store(root=tmp_path))
+   assert len(df_read) == 20 + 320
+   assert df_read[C.COL_STORE].nunique() == 320
+   assert df_read[C.COL_MM].astype(str).tolist() == (
+      ['2023/01'] * 20 + ['2023/02'] * 320
+   )
+
+
+def test_read_store_month_range(tmp_path):
+   months = ['2023/01', '2023/02', '2023/03', '2023/04']
+   save_store(make_ledger(['店'], months), 'v1', tmp_path)
+   df_read = read_store('2023/02', '2023/03', root=tmp_path)
+   assert df_read[C.COL_MM].astype(str).tolist() == ['2023/02', '2023/03']
+   assert len(read_store(ym_start='2023/04', root=tmp_path)) == 1
+
+
+# ===================== #
+# Incremental ingestion #
+# ===================== #
+def make_ctbc_tab(rows):
+   lines = [','.join(C.COLS_SHEET_CTBC)] + [
+      ','.join([date, amount, deposit, store, item] + [''] * 3)
+      for date, amount, deposit, store, item in rows
+   ]
+   return '\n'.join(lines).encode('utf-8')
+
+
+def test_ingest_table_keeps_bank_rows_of_appended_tabs(tmp_path, monkeypatch):
+   monkeypatch.setattr(C, 'CACHE_DIR', str(tmp_path))
+   adapter = ADAPTERS[C.SRC_CTBC]
+   rows = [
+      ('2023/01/05', '', '50000', '公司', '薪資'),
+      ('2023/01/06', '120', '', '全家', '')
+   ]
+   _, sides = ingest_table(adapter, '2023', make_ctbc_tab(rows))
+   assert sides['income'][C.COL_KIND].tolist() == [C.INC_SALARY]
+
+   rows.append(('2023/01/20', '3000', '', '', '花旗信用卡'))
+   rows.append(('2023/01/31', '', '3', '中信', '利息'))
+   df, sides = ingest_table(adapter, '2023', make_ctbc_tab(rows))
+   assert sides['payments'][C.COL_SOURCE].tolist() == [C.SRC_CITI]
+   assert sides['income'][C.COL_KIND].tolist() == [
+      C.INC_SALARY, C.INC_INTEREST
+   ]
+   assert sides['income'][C.COL_AMOUNT].tolist() == [50000, 3]
+   assert df[C.COL_STORE].tolist() == ['全家']
@@ -0,0 +1,37 @@
+import pandas as pd
+import consts as C
+from reconcile import match_topups
+
+
+# ======= #
+# Top-ups #
+# ======= #
+def make_rows(rows):
+   df = pd.DataFrame(rows, columns=[
+      C.COL_DATE, C.COL_STORE, C.COL_ITEM, C.COL_AMOUNT, C.COL_SOURCE,
+      C.COL_FREQ
+   ])
+   df[C.COL_DATE] = pd.to_datetime(df[C.COL_DATE])
+   return df
+
+
+def test_topup_twin_skips_rows_of_its_own_sheet():
+   # The closest same-amount row is in the same sheet, the twin is not
+   df = make_rows([
+      ('2023/01/01', '悠遊卡', '儲值', 500, C.SRC_CASH, C.FREQ_TOPUP),
+      ('2023/01/02', '全聯', '', 500, C.SRC_CASH, C.FREQ_ONCE),
+      ('2023/01/03', '悠遊卡', '', 500, C.SRC_CITI, C.FREQ_ONCE)
+   ])
+   df_twins, df_unmatched = match_topups(df)
+   assert df_twins[f'{C.COL_SOURCE}{C.COL_MATCH}'].tolist() == [C.SRC_CITI]
+   assert df_unmatched.empty
+
+
+def test_topup_without_twin_is_reported():
+   df = make_rows([
+      ('2023/01/01', '悠遊卡', '儲值', 500, C.SRC_CASH, C.FREQ_TOPUP),
+      ('2023/01/02', '全聯', '', 500, C.SRC_CASH, C.FREQ_ONCE)
+   ])
+   df_twins, df_unmatched = match_topups(df)
+   assert df_twins.empty
+   assert len(df_unmatched) == 1
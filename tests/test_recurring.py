@@ -0,0 +1,31 @@
+import pandas as pd
+import consts as C
+from recurring import detect_recurring
+
+
+# =============== #
+# Recurring rules #
+# =============== #
+def make_visits(visits):
+   df = pd.DataFrame(visits, columns=[C.COL_DATE, C.COL_STORE, C.COL_AMOUNT])
+   df[C.COL_DATE] = pd.to_datetime(df[C.COL_DATE])
+   df[C.COL_STORE] = df[C.COL_STORE].astype('category')
+   df[C.COL_FREQ] = C.FREQ_ONCE
+   return df
+
+
+def test_two_visits_a_year_apart_are_not_yearly():
+   df = make_visits([
+      ('2022/03/01', '全聯', 120),
+      ('2023/03/05', '全聯', 340)
+   ])
+   assert detect_recurring(df).empty
+
+
+def test_three_visits_a_year_apart_are_yearly():
+   df = make_visits([
+      ('2021/03/01', '保險', 12000),
+      ('2022/03/01', '保險', 12000),
+      ('2023/03/01', '保險', 12000)
+   ])
+   assert detect_recurring(df)[C.COL_FREQ].tolist() == [C.FREQ_YEAR]
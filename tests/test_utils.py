@@ -0,0 +1,92 @@
+import random
+import pandas as pd
+from utils import (
+   STORE_SYMBOLS,
+   STORE_TOKENS,
+   STORE_TRIM_CACHE,
+   trim_store,
+   trim_stores
+)
+
+
+# ============== #
+# Store trimming #
+# ============== #
+def trim_store_reference(s):
+   # The original trim_store, keywords written out in their original order
+   # so that a change to the tables in utils cannot hide in the reference
+   for kw_sym in ('－', '０', '/', '＊', '＆'):
+      s = s.replace(kw_sym, '')
+   for kw_loc in (
+      '台灣',
+      'TW',
+      'TAIPEI',
+      'Taipei',
+      'CITY',
+      'City',
+      'HSINCHU',
+      'YUANLIN',
+      'YUNLIN',
+      'TAICHUNG',
+      'KAOHSIUNG',
+      'PINGTUNG',
+      'Pingtung',
+      'TAITUNG',
+      'HUALIEN'
+   ):
+      s = s.replace(kw_loc, '')
+   for kw_store in (
+      '股份有限',
+      '時尚廣場',
+      '財團法人',
+      '便利商',
+      '實業',
+      '公司',
+      '餐廳',
+      '生活',
+      '百貨',
+      '超商',
+      '藥妝',
+      '門巿'
+   ):
+      s = s.replace(kw_store, '')
+   for kw_else in (
+      'Ｕｎｏｃｈ',
+      'ＭＯＳ',
+      '（Ｄ２',
+      '＆ｂ',
+      '不抵用五倍券',
+      '網路／語',
+      '電支'
+   ):
+      s = s.replace(kw_else, '')
+   return s.strip()
+
+
+def gen_store_names(num, seed=0):
+   # Keywords, their halves (so that a removal can join two halves into a
+   # later keyword) and filler, glued together at random
+   rng = random.Random(seed)
+   fragments = list(STORE_SYMBOLS + STORE_TOKENS)
+   fragments += [kw[:len(kw) // 2] for kw in STORE_TOKENS]
+   fragments += [kw[len(kw) // 2:] for kw in STORE_TOKENS]
+   fragments += ['全家', '7-11', 'a', 'T', 'W', ' ', '\t', '']
+   return [
+      ''.join(rng.choices(fragments, k=rng.randint(0, 8)))
+      for _ in range(num)
+   ]
+
+
+def test_trim_store_matches_reference():
+   for s in gen_store_names(20000):
+      assert trim_store(s) == trim_store_reference(s), repr(s)
+
+
+def test_trim_stores_matches_reference():
+   STORE_TRIM_CACHE.clear()
+   names = gen_store_names(20000, seed=1)
+   sr = pd.Series(names + names[:5000], dtype=object)
+   expected = [trim_store_reference(s) for s in sr]
+   assert trim_stores(sr).tolist() == expected
+   # Second pass is served from the cache
+   assert trim_stores(sr).tolist() == expected
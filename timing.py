@@ -0,0 +1,71 @@
+import io
+import json
+import time
+import pstats
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+# ====== #
+# Stages #
+# ====== #
+# Records of the stages run since the last pop_timings(), appended from any
+# thread (tabs are fetched and ingested in pools). Bounded, so a server
+# whose pages are never drained does not grow it forever
+TIMINGS_SIZE = 10000
+TIMINGS = deque(maxlen=TIMINGS_SIZE)
+TIMINGS_LOCK = threading.Lock()
+# INFO records would be dropped under the default WARNING level
+LOGGER = logging.getLogger('ledger.timing')
+LOGGER.setLevel(logging.INFO)
+if not LOGGER.handlers:
+   LOGGER.addHandler(logging.StreamHandler())
+
+
+@contextmanager
+def timed(stage, **fields):
+   # with timed('parse', table='2023') as record: record['rows'] = len(df)
+   record = dict(stage=stage, **fields)
+   start = time.perf_counter()
+   try:
+      yield record
+   finally:
+      record['seconds'] = round(time.perf_counter() - start, 4)
+      with TIMINGS_LOCK:
+         TIMINGS.append(record)
+
+
+def pop_timings():
+   with TIMINGS_LOCK:
+      records = list(TIMINGS)
+      TIMINGS.clear()
+   return records
+
+
+def log_timings(records):
+   if records:
+      LOGGER.info(json.dumps(records, ensure_ascii=False))
+
+
+def summarize_timings(records):
+   # One line per stage, slowest first
+   summary = dict()
+   for record in records:
+      stage = summary.setdefault(
+         record['stage'], dict(stage=record['stage'], calls=0, seconds=0)
+      )
+      stage['calls'] += 1
+      stage['seconds'] = round(stage['seconds'] + record['seconds'], 4)
+      if 'rows' in record:
+         stage['rows'] = stage.get('rows', 0) + record['rows']
+   return sorted(summary.values(), key=lambda s: s['seconds'], reverse=True)
+
+
+def format_profile(profiler, limit=30):
+   buf = io.StringIO()
+   pstats.Stats(profiler, stream=buf).sort_stats('cumulative').print_stats(
+      limit
+   )
+   return buf.getvalue()
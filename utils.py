@@ -1,108 +1,137 @@
 import io
-import requests
+import os
+import re
+import glob
+import json
+import hashlib
+import threading
+import numpy as np
 import pandas as pd
 from plotly import express as px
 import consts as C
+from fetch import write_atomic
 
 
 # =============== #
 # Private helpers #
 # =============== #
-def load_df_from_url(url, cols):
-   content = requests.get(url).content
-   df = pd.DataFrame()
+def load_df_from_content(content, cols):
+   # Parsed straight from the bytes, every column as text: amounts and
+   # dates are converted later by the adapters, which skips type inference
    df = pd.read_csv(
-      io.StringIO(content.decode('utf-8')),
-      usecols=cols
+      io.BytesIO(content),
+      encoding='utf-8',
+      usecols=cols,
+      dtype=str
    ).fillna(value='')
    return df
 
 
+def concat_tables(dfs, cols):
+   # Concatenate once instead of growing a frame table by table
+   if not dfs:
+      return pd.DataFrame(columns=cols)
+   return pd.concat(dfs, ignore_index=True)
+
+
 def rm_substr(s, kw, to_char=''):
    return s.replace(kw, to_char)
 
 
-def rm_comma(s):
-   return rm_substr(s, ',')
+def to_amount(sr):
+   # '1,234', '1,234.00', 1234.0 and '' all end up as plain numbers
+   return pd.to_numeric(
+      sr.astype(str).str.replace(',', '', regex=False),
+      errors='coerce'
+   ).fillna(0)
 
 
-def rm_float(s):
-   return rm_substr(s, '.00')
-
-
-def is_credit_bill(s):
-   return any(
-      kw in s for kw in ['花旗', '阿魚', '台新', '國泰', '渣打', '華南']
-   )
+CREDIT_BILL_KEYWORDS = ['花旗', '阿魚', '台新', '國泰', '渣打', '華南']
 
 
 # ============== #
 # Public helpers #
 # ============== #
+STORE_SYMBOLS = ('－', '０', '/', '＊', '＆')
+STORE_LOCATIONS = (
+   '台灣',
+   'TW',
+   'TAIPEI',
+   'Taipei',
+   'CITY',
+   'City',
+   'HSINCHU',
+   'YUANLIN',
+   'YUNLIN',
+   'TAICHUNG',
+   'KAOHSIUNG',
+   'PINGTUNG',
+   'Pingtung',
+   'TAITUNG',
+   'HUALIEN'
+)
+STORE_SUFFIXES = (
+   '股份有限',
+   '時尚廣場',
+   '財團法人',
+   '便利商',
+   '實業',
+   '公司',
+   '餐廳',
+   '生活',
+   '百貨',
+   '超商',
+   '藥妝',
+   '門巿'
+)
+STORE_MISC = (
+   'Ｕｎｏｃｈ',
+   'ＭＯＳ',
+   '（Ｄ２',
+   '＆ｂ',
+   '不抵用五倍券',
+   '網路／語',
+   '電支'
+)
+
+# Symbols are single characters, so deleting them at once is equivalent.
+# The other tokens stay sequential: removing one can join the halves of
+# a later one (e.g. 'T台灣W' -> 'TW'), which a single alternation misses.
+STORE_SYMBOL_TABLE = str.maketrans('', '', ''.join(STORE_SYMBOLS))
+STORE_TOKENS = STORE_LOCATIONS + STORE_SUFFIXES + STORE_MISC
+STORE_TRIM_CACHE = dict()
+
+
 def trim_store(s):
-   for kw_sym in ('－', '０', '/', '＊', '＆'):
-      s = rm_substr(s, kw_sym)
-   for kw_loc in (
-      '台灣',
-      'TW',
-      'TAIPEI',
-      'Taipei',
-      'CITY',
-      'City',
-      'HSINCHU',
-      'YUANLIN',
-      'YUNLIN',
-      'TAICHUNG',
-      'KAOHSIUNG',
-      'PINGTUNG',
-      'Pingtung',
-      'TAITUNG',
-      'HUALIEN'
-   ):
-      s = rm_substr(s, kw_loc)
-   for kw_store in (
-      '股份有限',
-      '時尚廣場',
-      '財團法人',
-      '便利商',
-      '實業',
-      '公司',
-      '餐廳',
-      '生活',
-      '百貨',
-      '超商',
-      '藥妝',
-      '門巿'
-   ):
-      s = rm_substr(s, kw_store)
-   for kw_else in (
-      'Ｕｎｏｃｈ',
-      'ＭＯＳ',
-      '（Ｄ２',
-      '＆ｂ',
-      '不抵用五倍券',
-      '網路／語',
-      '電支'
-   ):
-      s = rm_substr(s, kw_else)
+   s = s.translate(STORE_SYMBOL_TABLE)
+   for kw in STORE_TOKENS:
+      s = rm_substr(s, kw)
    return s.strip()
 
 
+def trim_stores(sr):
+   # Only unseen store names are trimmed, one vectorized pass per token
+   unseen = pd.Series(
+      [s for s in sr.unique() if s not in STORE_TRIM_CACHE],
+      dtype=object
+   )
+   trimmed = unseen.str.translate(STORE_SYMBOL_TABLE)
+   for kw in STORE_TOKENS:
+      trimmed = trimmed.str.replace(kw, '', regex=False)
+   STORE_TRIM_CACHE.update(zip(unseen, trimmed.str.strip()))
+   return sr.map(STORE_TRIM_CACHE)
+
+
 # ======= #
 # Mapping #
 # ======= #
-def store_to_tag(s):
-   if any(kw in s for kw in ['瓦斯', '中華電信', '台哥大']):
-      return C.TAG_BILL
-   elif any(kw in s for kw in ['必勝客']):
-      return C.TAG_FAMILY
-   elif any(kw in s for kw in ['宜家家居', '宜得利']):
-      return C.TAG_FURNISH
-   elif any(kw in s for kw in ['日藥本舖', '康是美', '金興發', '大創', '寶雅']):
-      return C.TAG_CONSUMABLE
-   elif any(kw in s for kw in ['健康食彩', '大潤發', '家樂福', '全聯', '黑沃', 'ＤＯＮ']):
-      return C.TAG_MARKET
-   elif any(kw in s for kw in [
+STORE_TAG_RULES = [
+   (C.TAG_BILL, ['瓦斯', '中華電信', '台哥大']),
+   (C.TAG_FAMILY, ['必勝客']),
+   (C.TAG_FURNISH, ['宜家家居', '宜得利']),
+   (C.TAG_CONSUMABLE, ['日藥本舖', '康是美', '金興發', '大創', '寶雅']),
+   (C.TAG_MARKET, ['健康食彩', '大潤發', '家樂福', '全聯', '黑沃', 'ＤＯＮ']),
+   (C.TAG_FORAGE, [
       'ＦｏｏｄＰａｎｄａ',
       'ｆｏｏｄｐａｎｄａ',
       'Ｌａｚｙ Ｐａ',
@@ -133,9 +162,8 @@ def store_to_tag(s):
       '素食',
       'ＯＫ',
       '巧福'
-   ]):
-      return C.TAG_FORAGE
-   elif any(kw in s for kw in [
+   ]),
+   (C.TAG_DRINK, [
       'ＣＯＭＥＢＵＹ',
       '約翰紅茶',
       '天仁茗茶',
@@ -149,9 +177,8 @@ def store_to_tag(s):
       '山焙',
       '樂法',
       '５嵐'
-   ]):
-      return C.TAG_DRINK
-   elif any(kw in s for kw in [
+   ]),
+   (C.TAG_SHOW, [
       '國家表演藝術中心',
       '臺北表演藝術中心',
       '融藝',
@@ -160,150 +187,148 @@ def store_to_tag(s):
       'ＫＫＴＩＸ',
       '威秀',
       '秀泰'
-   ]):
-      return C.TAG_SHOW
-   elif any(kw in s for kw in ['ＤＥＣＡＴＨＬＯＮ', '迪卡儂', '捷安特', '馬修單車']):
-      return C.TAG_EXERCISE
-   elif any(kw in s for kw in ['微笑單車', '悠遊付', '悠遊卡', 'Ｇｏ Ｓｈａｒｅ', '格上租車']):
-      return C.TAG_COMMUTE
-   elif any(kw in s for kw in ['計程車', '大都會衛星', '優步']):
-      return C.TAG_TAXI
-   else:
-      return C.TAG_DEFAULT
+   ]),
+   (C.TAG_EXERCISE, ['ＤＥＣＡＴＨＬＯＮ', '迪卡儂', '捷安特', '馬修單車']),
+   (C.TAG_COMMUTE, ['微笑單車', '悠遊付', '悠遊卡', 'Ｇｏ Ｓｈａｒｅ', '格上租車']),
+   (C.TAG_TAXI, ['計程車', '大都會衛星', '優步'])
+]
 
 
-def tag_to_class(tag):
-   if tag in C.TAGS_RENT:
-      return C.CLS_RENT
-   elif tag in C.TAGS_LIFE:
-      return C.CLS_LIFE
-   elif tag in C.TAGS_COOK:
-      return C.CLS_COOK
-   elif tag in C.TAGS_DINE:
-      return C.CLS_DINE
-   elif tag in C.TAGS_FUN:
-      return C.CLS_FUN
-   elif tag in C.TAGS_HEALTH:
-      return C.CLS_HEALTH
-   elif tag in C.TAGS_MOVE:
-      return C.CLS_MOVE
-   else:
-      return C.CLS_DEFAULT
-
-
-# ==== #
-# Cash #
-# ==== #
-# @st.cache(suppress_st_warning=True)
-def get_df_cash(sheet_id, tables=C.YY_LIST):
-   df = pd.DataFrame()
-   for yy in tables:
-      df_year = load_df_from_url(
-         f'{C.END_POINT}/{sheet_id}/gviz/tq?tqx=out:csv&sheet={yy}',
-         C.COLS_SHEET_CASH
-      )
-      df_year[C.COL_MM] = df_year[C.COL_MM].transform(
-         lambda mm: f'{yy}/{mm:02d}'
-      )
-      df = df.append(df_year, ignore_index=True)
-
-   df[C.COL_PAY] = df[C.COL_PAY].replace('', C.PAY_CASH)
-   return df
+def get_trie_pattern(kws):
+   # Prefix-factored alternation, so matching cost barely grows with kws
+   trie = dict()
+   for kw in kws:
+      node = trie
+      for char in kw:
+         node = node.setdefault(char, dict())
+      node[''] = dict()
 
+   def to_pattern(node):
+      alts = [
+         re.escape(char) + to_pattern(child)
+         for char, child in sorted(node.items()) if char
+      ]
+      if '' in node:
+         return f"(?:{'|'.join(alts)})?" if alts else ''
+      return alts[0] if len(alts) == 1 else f"(?:{'|'.join(alts)})"
 
-# ==== #
-# Bank #
-# ==== #
-def get_df_ctbc(sheet_id, tables=C.YY_LIST):
-   df = pd.DataFrame()
-   for yy in tables:
-      df_year = load_df_from_url(
-         f'{C.END_POINT}/{sheet_id}/gviz/tq?tqx=out:csv&sheet={yy}',
-         C.COLS_SHEET_CTBC,
-      )
-      df = df.append(df_year, ignore_index=True)
-
-   df[C.COL_MM] = df[C.COL_DATE].transform(
-      lambda s: '/'.join(s.split('/')[:-1])
-   )
-   df[C.COL_DD] = df[C.COL_DATE].str.split('/').transform(
-      lambda arr: arr[-1]
-   )
-   df.drop(columns=[C.COL_DATE], inplace=True)
-   for col in (C.COL_AMOUNT, C.COL_DEPOSIT):
-      df[col] = df[col].transform(rm_comma)
-
-   return df
+   return to_pattern(trie)
 
 
-def parse_spending_from_ctbc(df):
-   df.drop(columns=[C.COL_DEPOSIT], inplace=True)
-   df = df[df[C.COL_AMOUNT] != '']
-   df = df[df[C.COL_STORE] != 'ＡＴＭ']
+# Rules are tried in order, the first tag with a matching keyword wins
+STORE_TAG_PATTERNS = [
+   (tag, re.compile(get_trie_pattern(kws))) for tag, kws in STORE_TAG_RULES
+]
 
-   df = df[~df[C.COL_ITEM].transform(is_credit_bill)]
-   for kw, tag in zip(['孝親', '房租'], [C.TAG_FAMILY, C.TAG_SLEEP]):
-      df.loc[
-         df[C.COL_ITEM].str.contains(kw),
-         [C.COL_TAG, C.COL_FREQ]
-      ] = tag, C.FREQ_MONTH
-   df[C.COL_PAY] = df[C.COL_PAY].replace('', C.PAY_DIGIT)
 
-   return df
-
-
-# =========== #
-# Credit card #
-# =========== #
-def get_df_citi(sheet_id, tables=C.YY_LIST):
-   df = pd.DataFrame()
-   for yy in tables:
-      df_year = load_df_from_url(
-         f'{C.END_POINT}/{sheet_id}/gviz/tq?tqx=out:csv&sheet={yy}',
-         C.COLS_SHEET_CITI,
-      )
-      df = df.append(df_year, ignore_index=True)
-
-   df[C.COL_MM] = df[C.COL_DATE].transform(
-      lambda s: '/'.join(s.split('/')[::-1][:-1])
-   )
-   df[C.COL_DD] = df[C.COL_DATE].str.split('/').transform(
-      lambda arr: arr[0]
+def store_to_tag(s):
+   for tag, pattern in STORE_TAG_PATTERNS:
+      if pattern.search(s):
+         return tag
+   return C.TAG_DEFAULT
+
+
+def match_rules(sr, patterns, default):
+   # patterns: [(label, compiled pattern)], the first match wins. Each
+   # distinct value is matched once, one vectorized pass per rule
+   values = pd.Series(sr.unique(), dtype=object)
+   labels = np.select(
+      [
+         values.str.contains(pattern.pattern, regex=True).to_numpy(bool)
+         for _, pattern in patterns
+      ],
+      [label for label, _ in patterns],
+      default=default
    )
-   df.drop(columns=[C.COL_DATE], inplace=True)
-   df.query(f"{C.COL_AMOUNT} > 0", inplace=True)
-   df[C.COL_AMOUNT] = df[C.COL_AMOUNT].transform(rm_float).transform(rm_comma)
-   # 連加：Line Pay
-   for kw in ('街口', '連加'):
-      df.loc[df[C.COL_STORE].str.contains(kw), C.COL_PAY] = C.PAY_DIGIT
-   df[C.COL_PAY] = df[C.COL_PAY].replace('', C.PAY_CARD)
+   return sr.map(dict(zip(values, labels)))
 
-   return df
 
+def stores_to_tags(sr):
+   return match_rules(sr, STORE_TAG_PATTERNS, C.TAG_DEFAULT)
 
-def get_df_tsib(sheet_id, tables=C.YY_LIST):
-   df = pd.DataFrame()
-   for yy in tables:
-      df_year = load_df_from_url(
-         f'{C.END_POINT}/{sheet_id}/gviz/tq?tqx=out:csv&sheet={yy}',
-         C.COLS_SHEET_TSIB,
-      )
-      df = df.append(df_year, ignore_index=True)
 
-   df[[C.COL_YY, C.COL_MM, C.COL_DD]] = df[C.COL_DATE].str.split(
-      '/',
-      expand=True
-   )
-   df[C.COL_MM] = df[C.COL_MM].transform(lambda mm: f'{mm:0>2}')
-   df[C.COL_MM] = df[C.COL_YY] + '/' + df[C.COL_MM]
-   df.drop(columns=[C.COL_DATE, C.COL_YY], inplace=True)
-   # 連加：Line Pay
-   for kw in ('街口', '連加'):
-      df.loc[df[C.COL_STORE].str.contains(kw), C.COL_PAY] = C.PAY_DIGIT
-   df[C.COL_PAY] = df[C.COL_PAY].replace('', C.PAY_CARD)
+TAG_CLASS_RULES = [
+   (C.CLS_RENT, C.TAGS_RENT),
+   (C.CLS_LIFE, C.TAGS_LIFE),
+   (C.CLS_COOK, C.TAGS_COOK),
+   (C.CLS_DINE, C.TAGS_DINE),
+   (C.CLS_FUN, C.TAGS_FUN),
+   (C.CLS_HEALTH, C.TAGS_HEALTH),
+   (C.CLS_MOVE, C.TAGS_MOVE)
+]
+TAG_TO_CLASS = {
+   tag: cls for cls, tags in reversed(TAG_CLASS_RULES) for tag in tags
+}
 
-   return df
 
+def tag_to_class(tag):
+   return TAG_TO_CLASS.get(tag, C.CLS_DEFAULT)
+
+
+def tags_to_classes(sr):
+   return sr.map(TAG_TO_CLASS).fillna(C.CLS_DEFAULT)
+
+
+# ============ #
+# Store lookup #
+# ============ #
+STORE_LOOKUP = dict()
+STORE_LOOKUP_LOCK = threading.Lock()
+
+
+def get_rules_hash():
+   # Any edit to the trimming, tagging or class rules yields a new table
+   rules = [STORE_SYMBOLS, STORE_TOKENS, STORE_TAG_RULES, TAG_CLASS_RULES]
+   return hashlib.sha1(
+      json.dumps(rules, ensure_ascii=False).encode('utf-8')
+   ).hexdigest()[:16]
+
+
+def get_lookup_path(rules_hash):
+   return os.path.join(C.CACHE_DIR, f'stores-{rules_hash}.json')
+
+
+def load_lookup(rules_hash):
+   if rules_hash not in STORE_LOOKUP:
+      try:
+         with open(get_lookup_path(rules_hash), encoding='utf-8') as f:
+            STORE_LOOKUP[rules_hash] = json.load(f)
+      except (OSError, ValueError):
+         STORE_LOOKUP[rules_hash] = dict()
+   return STORE_LOOKUP[rules_hash]
+
+
+def save_lookup(rules_hash, lookup):
+   path = get_lookup_path(rules_hash)
+   for path_stale in glob.glob(get_lookup_path('*')):
+      if path_stale != path:
+         os.remove(path_stale)
+   write_atomic(path, json.dumps(lookup, ensure_ascii=False).encode('utf-8'))
+
+
+def classify_stores(sr):
+   # Raw store -> (store, tag, class), computed only for unseen stores
+   # Tabs are ingested from several threads, which share one lookup file
+   rules_hash = get_rules_hash()
+   codes, raws = pd.factorize(sr)
+   with STORE_LOOKUP_LOCK:
+      lookup = load_lookup(rules_hash)
+      unseen = pd.Series([s for s in raws if s not in lookup], dtype=object)
+      if not unseen.empty:
+         stores = trim_stores(unseen)
+         tags = stores_to_tags(stores)
+         lookup.update(zip(unseen, map(list, zip(
+            stores, tags, tags_to_classes(tags)
+         ))))
+         save_lookup(rules_hash, lookup)
+      rows = [lookup[s] for s in raws]
+
+   df = pd.DataFrame(
+      rows,
+      columns=[C.COL_STORE, C.COL_TAG, C.COL_CLASS]
+   ).iloc[codes]
+   df.index = sr.index
+   return df
 
 
 ########
@@ -315,6 +340,8 @@ def get_color_map(group=C.COL_CLASS):
       arr = C.PAYS
    elif group == C.COL_FREQ:
       arr = C.FREQS
+   elif group == C.COL_KIND:
+      arr = C.INCOMES
    map_hue = {
       elm: hue for elm, hue in zip(arr, px.colors.qualitative.Set3)
    }